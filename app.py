@@ -1,14 +1,36 @@
 
 from flask import Flask, request, jsonify, session
 from flask_cors import CORS
+import click
 from werkzeug.security import generate_password_hash, check_password_hash
+import atexit
 import json
 import os
+import sys
+import threading
+import time
 import uuid
+from bisect import bisect_left, insort
 from datetime import datetime
 
+from bulk_transfer import ImportReport, export_csv, export_lines, gzip_chunks, read_batches
+from course_layouts import CourseLayouts, assign_lecture_ids
+from instructor_metrics import InstructorMetrics
+from lecture_funnel import compute_funnel
+from json_patch import JsonPatchError, JsonPatchTestFailed, apply_patch
+from notes_store import NotesLimitError, NotesStore
+from progress_engine import ProgressEngine
+from qna_store import QnaStore
+from question_similarity import QuestionSimilarity
+from quiz_analytics import QuizAnalytics
+from quiz_attempts import QuizAttemptLog, build_attempt
+from quiz_grading import AnswerKeyIndex
+from quiz_leaderboard import QuizLeaderboard
+from roster import ROSTER_SORT_FIELDS, RosterCache, decode_cursor, roster_page, sort_value
+from time_series import GRANULARITIES, parse_day
+
 app = Flask(__name__)
-CORS(app, supports_credentials=True)
+CORS(app, supports_credentials=True, expose_headers=['ETag'])
 app.secret_key = 'your_secret_key_here'  # Change this to a secure random key in production
 
 # Initialize our data storage (in a real app, this would be a database)
@@ -16,6 +38,32 @@ USERS_FILE = 'data/users.json'
 COURSES_FILE = 'data/courses.json'
 ENROLLMENTS_FILE = 'data/enrollments.json'
 PROGRESS_FILE = 'data/progress.json'
+NOTES_DIR = 'data/notes'
+QUIZ_ATTEMPTS_FILE = 'data/quiz_attempts.ndjson'
+QNA_FILE = 'data/qna.ndjson'
+COURSE_DELETIONS_FILE = 'data/course_deletions.json'
+COURSE_LAYOUTS_FILE = 'data/course_layouts.ndjson'
+
+# How often buffered video heartbeats are written to progress.json (seconds)
+HEARTBEAT_FLUSH_INTERVAL = 15
+
+# Lecture questions returned per page (and inlined per lecture in course content)
+QNA_PAGE_SIZE = 20
+
+# Deleted courses' enrollments and progress are purged in the background, this
+# many records per file write, checking for new deletions at this interval (seconds)
+COURSE_PURGE_BATCH_SIZE = 500
+COURSE_PURGE_INTERVAL = 5
+
+# Longest time series a single request may ask for
+MAX_TIMESERIES_BUCKETS = 1000
+
+# Lecture funnels are reused until the course changes or they are this old (seconds)
+LECTURE_FUNNEL_MAX_AGE = 300
+
+# Students per roster page, by default and at most
+ROSTER_PAGE_SIZE = 50
+MAX_ROSTER_PAGE_SIZE = 200
 
 # Create data directory if it doesn't exist
 os.makedirs('data', exist_ok=True)
@@ -31,6 +79,24 @@ initialize_json_file(USERS_FILE, {'users': []})
 initialize_json_file(COURSES_FILE, {'courses': []})
 initialize_json_file(ENROLLMENTS_FILE, {'enrollments': []})
 initialize_json_file(PROGRESS_FILE, {'progress': []})
+initialize_json_file(COURSE_DELETIONS_FILE, {'deletions': []})
+
+# Lecture notes live in their own store, one file per (user, course, lecture)
+notes_store = NotesStore(NOTES_DIR)
+
+# Versions of each course's lecture order, with remap tables between them
+course_layouts = CourseLayouts(COURSE_LAYOUTS_FILE)
+
+# Lecture Q&A is an append-only event log rather than part of courses.json
+qna_store = QnaStore(QNA_FILE, course_layouts)
+
+# Near-duplicate lookup over each lecture's questions
+question_similarity = QuestionSimilarity(qna_store)
+
+# Held for the whole read-modify-write of a data file. Requests are served on
+# several threads and background threads write the same files, so an update
+# made between another writer's read and write would otherwise be lost.
+_data_lock = threading.RLock()
 
 # Helper functions to read and write data
 def read_json_file(file_path):
@@ -38,8 +104,310 @@ def read_json_file(file_path):
         return json.load(f)
 
 def write_json_file(file_path, data):
-    with open(file_path, 'w') as f:
+    # Written to a temporary file and renamed over the original, so readers in
+    # other threads (e.g. the course purger) never see a half-written file
+    temp_path = f'{file_path}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'w') as f:
         json.dump(data, f, indent=4)
+    os.replace(temp_path, file_path)
+    _write_generations[file_path] = _write_generations.get(file_path, 0) + 1
+
+# In-memory indexes over the data files. An index is rebuilt from disk when its
+# file changes; handlers that update an index in place call sync_index() after
+# writing the file so the index is not rebuilt on the next read.
+_indexes = {}
+_write_generations = {}
+
+def _file_signature(file_path):
+    stat = os.stat(file_path)
+    return (_write_generations.get(file_path, 0), stat.st_mtime_ns, stat.st_size)
+
+# Indexes that leave out courses being deleted; they are rebuilt when a
+# deletion starts or completes as well as when their own file changes
+TOMBSTONE_FILTERED_INDEXES = ('courses', 'enrollments', 'progress', 'recent_activity')
+
+def _index_signature(name, file_path):
+    signature = _file_signature(file_path)
+    if name in TOMBSTONE_FILTERED_INDEXES:
+        signature = (signature, _file_signature(COURSE_DELETIONS_FILE))
+    return signature
+
+def get_index(name, file_path, build):
+    entry = _indexes.get(name)
+    signature = _index_signature(name, file_path)
+    if entry is None or entry['signature'] != signature:
+        entry = {'signature': signature, 'value': build(read_json_file(file_path))}
+        _indexes[name] = entry
+    return entry['value']
+
+def sync_index(name, file_path):
+    if name in _indexes:
+        _indexes[name]['signature'] = _index_signature(name, file_path)
+
+def build_users_index(users_data):
+    index = {'by_id': {}, 'by_email': {}}
+    for user in users_data['users']:
+        index['by_id'][user['id']] = user
+        index['by_email'][user['email'].lower()] = user
+    return index
+
+def build_enrollments_index(enrollments_data):
+    index = {'by_user': {}, 'by_course': {}}
+    deleted_course_ids = get_deleted_course_ids()
+    for enrollment in enrollments_data['enrollments']:
+        if enrollment['courseId'] not in deleted_course_ids:
+            add_enrollment_to_index(index, enrollment)
+    return index
+
+def add_enrollment_to_index(index, enrollment):
+    index['by_user'].setdefault(enrollment['userId'], {})[enrollment['courseId']] = enrollment
+    index['by_course'].setdefault(enrollment['courseId'], {})[enrollment['userId']] = enrollment
+
+def build_progress_index(progress_data):
+    index = {'by_user': {}}
+    deleted_course_ids = get_deleted_course_ids()
+    for progress in progress_data['progress']:
+        if progress['courseId'] not in deleted_course_ids:
+            index['by_user'].setdefault(progress['userId'], {})[progress['courseId']] = progress
+    return index
+
+def build_courses_index(courses_data):
+    deleted_course_ids = get_deleted_course_ids()
+    return {'by_id': {course['id']: course for course in courses_data['courses']
+                      if course['id'] not in deleted_course_ids}}
+
+# Tombstones: courses whose deletion has been requested but not yet purged.
+# Their records stay on disk until the purger reaches them, so lookups and
+# index builds skip them and writers refuse to add new records for them.
+def build_deleted_course_ids(deletions_data):
+    return {deletion['courseId'] for deletion in deletions_data['deletions'] if deletion['status'] != 'completed'}
+
+def get_deleted_course_ids():
+    return get_index('deletions', COURSE_DELETIONS_FILE, build_deleted_course_ids)
+
+def get_users_index():
+    return get_index('users', USERS_FILE, build_users_index)
+
+def get_enrollments_index():
+    return get_index('enrollments', ENROLLMENTS_FILE, build_enrollments_index)
+
+def get_progress_index():
+    return get_index('progress', PROGRESS_FILE, build_progress_index)
+
+def get_courses_index():
+    return get_index('courses', COURSES_FILE, build_courses_index)
+
+# Per-user activity ordered by updatedAt. 'order' holds (updatedAt, courseId)
+# pairs kept sorted with bisect, so moving a course to the front is a binary
+# search rather than a rescan of progress.json. 'positions' holds each course's
+# place in 'order'; lecture positions are read from the progress record.
+def build_recent_activity_index(progress_data):
+    index = {}
+    deleted_course_ids = get_deleted_course_ids()
+    for progress in progress_data['progress']:
+        if progress['courseId'] not in deleted_course_ids:
+            update_recent_activity(index, progress)
+    return index
+
+def update_recent_activity(index, progress):
+    activity = index.setdefault(progress['userId'], {'order': [], 'positions': {}})
+    course_id = progress['courseId']
+    previous = activity['positions'].get(course_id)
+    if previous:
+        pos = bisect_left(activity['order'], (previous['updatedAt'], course_id))
+        if pos < len(activity['order']) and activity['order'][pos] == (previous['updatedAt'], course_id):
+            del activity['order'][pos]
+    
+    updated_at = progress.get('updatedAt') or progress.get('lastActivity', '')
+    activity['positions'][course_id] = {'updatedAt': updated_at}
+    insort(activity['order'], (updated_at, course_id))
+
+def get_recent_activity_index():
+    return get_index('recent_activity', PROGRESS_FILE, build_recent_activity_index)
+
+# Course change events. Handlers that modify a course call
+# emit_course_change() with the JSON pointers they touched (None when the whole
+# course was replaced or deleted), and each per-course cache drops or keeps its
+# entry depending on whether those paths affect it.
+_course_change_listeners = []
+
+def on_course_change(listener):
+    _course_change_listeners.append(listener)
+    return listener
+
+def emit_course_change(course_id, course, paths=None):
+    for listener in _course_change_listeners:
+        listener(course_id, course, paths)
+
+def paths_touch(paths, *prefixes):
+    if paths is None:
+        return True
+    return any(path == prefix or path.startswith(prefix + '/') for path in paths for prefix in prefixes)
+
+def paths_restructure_lectures(paths):
+    # Changes at /sections, /sections/N, /sections/N/lectures or
+    # /sections/N/lectures/M can add, remove or reorder lectures
+    if paths is None:
+        return True
+    return any(path.startswith('/sections') and len(path.split('/')) <= 5 for path in paths)
+
+# Lecture totals per course, filled on first use and dropped whenever the
+# course's lectures change, so completion math never walks the sections.
+_course_structures = {}
+
+def get_course_structure(course_id):
+    structure = _course_structures.get(course_id)
+    if structure is None:
+        course = get_courses_index()['by_id'].get(course_id)
+        if not course:
+            return None
+        section_lecture_counts = [len(section.get('lectures', [])) for section in course.get('sections', [])]
+        structure = {
+            'sectionLectureCounts': section_lecture_counts,
+            'totalLectures': sum(section_lecture_counts)
+        }
+        _course_structures[course_id] = structure
+    return structure
+
+@on_course_change
+def invalidate_course_structure(course_id, course, paths):
+    if paths_restructure_lectures(paths):
+        _course_structures.pop(course_id, None)
+
+def get_section_lecture_counts(course_id):
+    structure = get_course_structure(course_id)
+    return structure['sectionLectureCounts'] if structure else None
+
+progress_engine = ProgressEngine(get_section_lecture_counts, course_layouts)
+
+@on_course_change
+def record_course_layout(course_id, course, paths):
+    if course is not None and paths_restructure_lectures(paths):
+        course_layouts.record(course_id, course.get('sections', []))
+
+def sync_notes_layout(user_id, course_id):
+    # Moves the user's notes for the course to the current lecture positions
+    # and returns the layout version they are now stored under
+    layout_version = course_layouts.current_version(course_id)
+    if layout_version:
+        notes_store.sync_layout(user_id, course_id, layout_version,
+                                lambda from_version: course_layouts.remap(course_id, from_version))
+    return layout_version or None
+
+def load_instructor_metrics_data():
+    return read_json_file(COURSES_FILE)['courses'], read_json_file(ENROLLMENTS_FILE)['enrollments']
+
+# Dashboard totals per instructor, adjusted on every enrollment and course change
+instructor_metrics = InstructorMetrics(load_instructor_metrics_data)
+
+@on_course_change
+def update_instructor_metrics(course_id, course, paths):
+    if course is None:
+        instructor_metrics.course_removed(course_id)
+    elif paths_touch(paths, '/price', '/instructorId'):
+        instructor_metrics.course_changed(course)
+
+# Quiz answer keys compiled per course, used to grade submissions server-side
+answer_keys = AnswerKeyIndex(lambda course: course_version(course))
+
+@on_course_change
+def invalidate_answer_key(course_id, course, paths):
+    if course is None or paths_restructure_lectures(paths) or \
+            any(path.startswith('/sections') and path.split('/')[5:6] == ['quiz'] for path in paths):
+        answer_keys.invalidate(course_id)
+    else:
+        answer_keys.rebind(course)
+
+# Every graded attempt, appended one line at a time
+quiz_attempts = QuizAttemptLog(QUIZ_ATTEMPTS_FILE, course_layouts)
+
+def get_answer_key(course_id):
+    course = get_courses_index()['by_id'].get(course_id)
+    return answer_keys.get(course) if course else None
+
+# Per-question attempt counts, correct rates and option histograms
+quiz_analytics = QuizAnalytics(quiz_attempts, get_answer_key)
+
+# Students ranked by the sum of their best quiz scores in each course
+quiz_leaderboard = QuizLeaderboard(quiz_attempts)
+
+@on_course_change
+def invalidate_lecture_indexes(course_id, course, paths):
+    # Rebuilt from the stores, which move questions and attempts to the new
+    # lecture positions (and leave out removed lectures) when next read
+    if course is None or paths_restructure_lectures(paths):
+        question_similarity.invalidate(course_id)
+        quiz_leaderboard.invalidate(course_id)
+
+# Serialized course player payloads. The course JSON is dumped once per course
+# version and split at each lecture's per-user fields (and at the top-level
+# progress fields), so a request only joins the fragments with the caller's
+# overlay and never copies or mutates the shared course dict.
+_course_content_templates = {}
+_OVERLAY_MARKER = '__overlay_%s__' % uuid.uuid4().hex
+_OVERLAY_SPLIT = json.dumps({_OVERLAY_MARKER: None})[1:-1]
+
+@on_course_change
+def invalidate_course_content_template(course_id, course, paths):
+    entry = _course_content_templates.get(course_id)
+    if entry is None:
+        return
+    if course is None or paths_touch(paths, '/title', '/sections', '/annonces', '/reviews'):
+        del _course_content_templates[course_id]
+    else:
+        entry['version'] = course_version(course)
+
+def get_course_content_template(course):
+    entry = _course_content_templates.get(course['id'])
+    if entry is None or entry['version'] != course_version(course):
+        sections = []
+        lecture_positions = []
+        for s_index, section in enumerate(course.get('sections', [])):
+            lectures = []
+            for l_index, lecture in enumerate(section.get('lectures', [])):
+                lecture = {k: v for k, v in lecture.items() if k not in ('completed', 'notes', 'qna')}
+                lecture[_OVERLAY_MARKER] = None
+                lectures.append(lecture)
+                lecture_positions.append((s_index, l_index))
+            sections.append(dict(section, lectures=lectures))
+        content = {
+            'id': course['id'],
+            'title': course['title'],
+            'sections': sections,
+            'annonces': course.get('annonces', []),
+            'reviews': course.get('reviews', []),
+            _OVERLAY_MARKER: None
+        }
+        entry = {
+            'version': course_version(course),
+            'lectures': lecture_positions,
+            'fragments': json.dumps(content).split(_OVERLAY_SPLIT)
+        }
+        _course_content_templates[course['id']] = entry
+    return entry
+
+def find_progress(progress_data, user_id, course_id):
+    # Returns the record's position in progress_data and the loaded progress
+    for position, record in enumerate(progress_data['progress']):
+        if record['userId'] == user_id and record['courseId'] == course_id:
+            return position, progress_engine.load(record)
+    return None, None
+
+def save_progress(progress_data, position, progress):
+    progress_data['progress'][position] = progress_engine.dump(progress)
+
+def write_progress_file(progress_data, changed):
+    # Writes progress.json and applies the changed records to the progress
+    # indexes in place. Both are brought up to date before the write, so after
+    # the changes they match the new file and are not rebuilt on the next read.
+    progress_index = get_progress_index()
+    recent_activity = get_recent_activity_index()
+    write_json_file(PROGRESS_FILE, progress_data)
+    for record in changed:
+        progress_index['by_user'].setdefault(record['userId'], {})[record['courseId']] = record
+        update_recent_activity(recent_activity, record)
+    sync_index('progress', PROGRESS_FILE)
+    sync_index('recent_activity', PROGRESS_FILE)
 
 # Authentication routes
 @app.route('/api/auth/register', methods=['POST'])
@@ -150,11 +518,13 @@ def get_all_courses():
 
 @app.route('/api/courses/<course_id>', methods=['GET'])
 def get_course_by_id(course_id):
-    courses_data = read_json_file(COURSES_FILE)
+    course = get_courses_index()['by_id'].get(course_id)
     
-    for course in courses_data['courses']:
-        if course['id'] == course_id:
-            return jsonify(course), 200
+    if course:
+        # The ETag is the course version that PATCH expects in If-Match
+        response = jsonify(course)
+        response.headers['ETag'] = course_etag(course)
+        return response, 200
     
     return jsonify({"error": "Course not found"}), 404
 
@@ -193,14 +563,17 @@ def create_course():
         'level': data.get('level', 'beginner'),
         'enrolledCount': 0,
         'duration': data.get('duration', '0h'),
-        'sections': data.get('sections', []),
+        'sections': assign_lecture_ids(data.get('sections', [])),
         'createdAt': datetime.now().isoformat(),
         'updatedAt': datetime.now().isoformat()
     }
     
-    courses_data = read_json_file(COURSES_FILE)
-    courses_data['courses'].append(new_course)
-    write_json_file(COURSES_FILE, courses_data)
+    with _data_lock:
+        courses_data = read_json_file(COURSES_FILE)
+        courses_data['courses'].append(new_course)
+        write_json_file(COURSES_FILE, courses_data)
+    course_layouts.record(new_course['id'], new_course['sections'])
+    instructor_metrics.course_changed(new_course)
     
     return jsonify(new_course), 201
 
@@ -210,8 +583,55 @@ def update_course(course_id):
     if not user_id:
         return jsonify({"error": "Not authenticated"}), 401
     
-    courses_data = read_json_file(COURSES_FILE)
-    course = next((c for c in courses_data['courses'] if c['id'] == course_id), None)
+    data = request.get_json()
+    
+    with _data_lock:
+        courses_data = read_json_file(COURSES_FILE)
+        course = next((c for c in courses_data['courses'] if c['id'] == course_id), None)
+        
+        if not course:
+            return jsonify({"error": "Course not found"}), 404
+        
+        if course['instructorId'] != user_id:
+            return jsonify({"error": "Only the course creator can update this course"}), 403
+        
+        # Update course fields
+        changed_paths = []
+        for key, value in data.items():
+            if key not in PROTECTED_COURSE_FIELDS:
+                if key == 'sections':
+                    # Lectures keep their ids so progress follows them when reordered
+                    value = assign_lecture_ids(value, course.get('sections'))
+                course[key] = value
+                changed_paths.append('/' + key)
+        
+        course['version'] = course_version(course) + 1
+        course['updatedAt'] = datetime.now().isoformat()
+        
+        write_json_file(COURSES_FILE, courses_data)
+        emit_course_change(course_id, course, changed_paths)
+    
+    response = jsonify(course)
+    response.headers['ETag'] = course_etag(course)
+    return response, 200
+
+# Fields that are managed by the server and cannot be set through PUT or PATCH
+PROTECTED_COURSE_FIELDS = ('id', 'instructorId', 'instructor', 'createdAt', 'enrolledCount', 'version', 'updatedAt')
+
+def course_version(course):
+    return course.get('version', 1)
+
+def course_etag(course):
+    return f'"{course_version(course)}"'
+
+@app.route('/api/courses/<course_id>', methods=['PATCH'])
+def patch_course(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    courses_index = get_courses_index()
+    course = courses_index['by_id'].get(course_id)
     
     if not course:
         return jsonify({"error": "Course not found"}), 404
@@ -219,18 +639,56 @@ def update_course(course_id):
     if course['instructorId'] != user_id:
         return jsonify({"error": "Only the course creator can update this course"}), 403
     
-    data = request.get_json()
-    
-    # Update course fields
-    for key, value in data.items():
-        if key not in ['id', 'instructorId', 'instructor', 'createdAt', 'enrolledCount']:
-            course[key] = value
-    
-    course['updatedAt'] = datetime.now().isoformat()
-    
-    write_json_file(COURSES_FILE, courses_data)
+    # The client sends back the ETag it read, so concurrent edits cannot
+    # silently overwrite each other
+    if_match = request.headers.get('If-Match', '').strip()
+    if not if_match:
+        return jsonify({"error": "An If-Match header with the course version is required"}), 428
+    if if_match.startswith('W/'):
+        if_match = if_match[2:]
+    
+    # The version is compared against courses.json itself and the patched
+    # course written back under the same lock, so of two requests holding the
+    # same ETag only the first one applies
+    with _data_lock:
+        courses_data = read_json_file(COURSES_FILE)
+        position, course = next(((i, c) for i, c in enumerate(courses_data['courses']) if c['id'] == course_id), (None, None))
+        
+        if not course:
+            return jsonify({"error": "Course not found"}), 404
+        
+        if if_match != '*' and if_match.strip('"') != str(course_version(course)):
+            return jsonify({"error": "The course was modified since it was read", "version": course_version(course)}), 412
+        
+        try:
+            patched, changed_paths = apply_patch(course, request.get_json())
+        except JsonPatchTestFailed as e:
+            return jsonify({"error": str(e)}), 409
+        except JsonPatchError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if paths_touch(changed_paths, *('/' + field for field in PROTECTED_COURSE_FIELDS)):
+            return jsonify({"error": "Protected course fields cannot be changed"}), 400
+        
+        if not isinstance(patched.get('sections', []), list) or \
+                not all(isinstance(section, dict) and isinstance(section.get('lectures', []), list) for section in patched.get('sections', [])):
+            return jsonify({"error": "Sections must be a list of sections with lecture lists"}), 400
+        
+        patched = dict(patched, version=course_version(course) + 1, updatedAt=datetime.now().isoformat())
+        if paths_touch(changed_paths, '/sections'):
+            patched['sections'] = assign_lecture_ids(patched.get('sections', []), course.get('sections'))
+        
+        # courses.json is a single document, so the file is still written whole,
+        # but only this course's index entry and the caches its paths affect change
+        courses_data['courses'][position] = patched
+        write_json_file(COURSES_FILE, courses_data)
+        courses_index['by_id'][course_id] = patched
+        sync_index('courses', COURSES_FILE)
+        emit_course_change(course_id, patched, changed_paths)
     
-    return jsonify(course), 200
+    response = jsonify(patched)
+    response.headers['ETag'] = course_etag(patched)
+    return response, 200
 
 @app.route('/api/courses/<course_id>', methods=['DELETE'])
 def delete_course(course_id):
@@ -238,30 +696,69 @@ def delete_course(course_id):
     if not user_id:
         return jsonify({"error": "Not authenticated"}), 401
     
-    courses_data = read_json_file(COURSES_FILE)
-    course = next((c for c in courses_data['courses'] if c['id'] == course_id), None)
-    
-    if not course:
-        return jsonify({"error": "Course not found"}), 404
+    # The course disappears from reads right away; its enrollments, progress
+    # and notes are purged by the background worker (see run_course_purger).
+    # Checked and removed under the lock so an edit or a second delete cannot
+    # slip in between
+    with _data_lock:
+        courses_data = read_json_file(COURSES_FILE)
+        course = next((c for c in courses_data['courses'] if c['id'] == course_id), None)
+        
+        if not course:
+            return jsonify({"error": "Course not found"}), 404
+        
+        if course['instructorId'] != user_id:
+            return jsonify({"error": "Only the course creator can delete this course"}), 403
+        
+        deletions_data = read_json_file(COURSE_DELETIONS_FILE)
+        deletion = {
+            'courseId': course_id,
+            'title': course.get('title'),
+            'instructorId': user_id,
+            'status': 'pending',
+            'enrollmentsPurged': 0,
+            'progressPurged': 0,
+            'requestedAt': datetime.now().isoformat(),
+            'completedAt': None
+        }
+        deletions_data['deletions'].append(deletion)
+        write_json_file(COURSE_DELETIONS_FILE, deletions_data)
+        
+        courses_data['courses'] = [c for c in courses_data['courses'] if c['id'] != course_id]
+        write_json_file(COURSES_FILE, courses_data)
+        emit_course_change(course_id, None)
+    _course_purge_wakeup.set()
     
-    if course['instructorId'] != user_id:
-        return jsonify({"error": "Only the course creator can delete this course"}), 403
+    return jsonify({"message": "Course deleted successfully", "deletion": deletion}), 202
+
+@app.route('/api/courses/<course_id>/deletion', methods=['GET'])
+def get_course_deletion_status(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
     
-    courses_data['courses'] = [c for c in courses_data['courses'] if c['id'] != course_id]
-    write_json_file(COURSES_FILE, courses_data)
+    deletions_data = read_json_file(COURSE_DELETIONS_FILE)
+    deletion = next((d for d in reversed(deletions_data['deletions']) if d['courseId'] == course_id), None)
     
-    # Also remove enrollments and progress for this course
-    enrollments_data = read_json_file(ENROLLMENTS_FILE)
-    enrollments_data['enrollments'] = [e for e in enrollments_data['enrollments'] if e['courseId'] != course_id]
-    write_json_file(ENROLLMENTS_FILE, enrollments_data)
+    if not deletion:
+        return jsonify({"error": "No deletion found for this course"}), 404
     
-    progress_data = read_json_file(PROGRESS_FILE)
-    progress_data['progress'] = [p for p in progress_data['progress'] if p['courseId'] != course_id]
-    write_json_file(PROGRESS_FILE, progress_data)
+    if deletion['instructorId'] != user_id:
+        return jsonify({"error": "Only the course creator can view this deletion"}), 403
     
-    return jsonify({"message": "Course deleted successfully"}), 200
+    return jsonify(deletion), 200
 
 # Enrollment routes
+def increment_enrolled_count(course_id, count=1):
+    # courses.json is re-read under the lock: writing back a copy read at the
+    # start of the request would undo course edits made in the meantime
+    with _data_lock:
+        courses_data = read_json_file(COURSES_FILE)
+        course = next((c for c in courses_data['courses'] if c['id'] == course_id), None)
+        if course:
+            course['enrolledCount'] = course.get('enrolledCount', 0) + count
+            write_json_file(COURSES_FILE, courses_data)
+
 @app.route('/api/courses/<course_id>/enroll', methods=['POST'])
 def enroll_in_course(course_id):
     user_id = session.get('user_id')
@@ -274,31 +771,139 @@ def enroll_in_course(course_id):
     if not course:
         return jsonify({"error": "Course not found"}), 404
     
-    enrollments_data = read_json_file(ENROLLMENTS_FILE)
-    
-    # Check if already enrolled
-    if any(e['userId'] == user_id and e['courseId'] == course_id for e in enrollments_data['enrollments']):
-        return jsonify({"message": "Already enrolled in this course"}), 200
+    with _data_lock:
+        # The course may have been deleted since it was read; an enrollment
+        # added now would outlive the purge of its records
+        if course_id in get_deleted_course_ids():
+            return jsonify({"error": "Course not found"}), 404
+        
+        enrollments_data = read_json_file(ENROLLMENTS_FILE)
+        
+        # Check if already enrolled
+        if any(e['userId'] == user_id and e['courseId'] == course_id for e in enrollments_data['enrollments']):
+            return jsonify({"message": "Already enrolled in this course"}), 200
+        
+        # Create new enrollment
+        new_enrollment = {
+            'id': str(uuid.uuid4()),
+            'userId': user_id,
+            'courseId': course_id,
+            'enrolledAt': datetime.now().isoformat()
+        }
+        
+        enrollments_data['enrollments'].append(new_enrollment)
+        write_json_file(ENROLLMENTS_FILE, enrollments_data)
+        
+        # Increment enrolled count for the course
+        increment_enrolled_count(course_id)
+        
+        # Initialize progress for this course
+        initialize_course_progress(user_id, course_id)
+    instructor_metrics.add_enrollment(new_enrollment)
     
-    # Create new enrollment
-    new_enrollment = {
-        'id': str(uuid.uuid4()),
-        'userId': user_id,
-        'courseId': course_id,
-        'enrolledAt': datetime.now().isoformat()
-    }
+    return jsonify({"message": "Successfully enrolled in the course"}), 201
+
+@app.route('/api/courses/<course_id>/enroll/bulk', methods=['POST'])
+def bulk_enroll_in_course(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
     
-    enrollments_data['enrollments'].append(new_enrollment)
-    write_json_file(ENROLLMENTS_FILE, enrollments_data)
+    courses_data = read_json_file(COURSES_FILE)
+    course = next((c for c in courses_data['courses'] if c['id'] == course_id), None)
     
-    # Increment enrolled count for the course
-    course['enrolledCount'] = course.get('enrolledCount', 0) + 1
-    write_json_file(COURSES_FILE, courses_data)
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
     
-    # Initialize progress for this course
-    initialize_course_progress(user_id, course_id, course)
+    if course.get('instructorId') != user_id:
+        return jsonify({"error": "Only the instructor can enroll students in bulk"}), 403
+    
+    data = request.get_json() or {}
+    user_ids = data.get('userIds', [])
+    emails = data.get('emails', [])
+    
+    if not isinstance(user_ids, list) or not isinstance(emails, list) or not (user_ids or emails):
+        return jsonify({"error": "A list of userIds or emails is required"}), 400
+    
+    if not all(isinstance(value, str) for value in user_ids + emails):
+        return jsonify({"error": "userIds and emails must be strings"}), 400
+    
+    users_index = get_users_index()
+    enrollments_index = get_enrollments_index()
+    enrolled_user_ids = enrollments_index['by_course'].get(course_id, {})
+    
+    # Resolve every requested user against the indexes before writing anything
+    results = []
+    new_user_ids = []
+    pending_user_ids = set()
+    for key, value in [('userId', v) for v in user_ids] + [('email', v) for v in emails]:
+        if key == 'userId':
+            user = users_index['by_id'].get(value)
+        else:
+            user = users_index['by_email'].get(value.lower())
+        
+        if not user:
+            status = 'not_found'
+        elif user['id'] in enrolled_user_ids:
+            status = 'already_enrolled'
+        elif user['id'] in pending_user_ids:
+            status = 'duplicate'
+        else:
+            status = 'enrolled'
+            new_user_ids.append(user['id'])
+            pending_user_ids.add(user['id'])
+        
+        result = {key: value, 'status': status}
+        if user:
+            result['userId'] = user['id']
+        results.append(result)
+    
+    if new_user_ids:
+        # One write per store for the whole cohort
+        enrolled_at = datetime.now().isoformat()
+        
+        with _data_lock:
+            if course_id in get_deleted_course_ids():
+                return jsonify({"error": "Course not found"}), 404
+            
+            # Re-check against the file itself: another request may have
+            # enrolled some of these users since the index was read
+            enrollments_data = read_json_file(ENROLLMENTS_FILE)
+            already_enrolled = {e['userId'] for e in enrollments_data['enrollments'] if e['courseId'] == course_id}
+            for result in results:
+                if result['status'] == 'enrolled' and result['userId'] in already_enrolled:
+                    result['status'] = 'already_enrolled'
+            new_user_ids = [new_user_id for new_user_id in new_user_ids if new_user_id not in already_enrolled]
+            
+            new_enrollments = [{
+                'id': str(uuid.uuid4()),
+                'userId': new_user_id,
+                'courseId': course_id,
+                'enrolledAt': enrolled_at
+            } for new_user_id in new_user_ids]
+            
+            if new_enrollments:
+                enrollments_data['enrollments'].extend(new_enrollments)
+                write_json_file(ENROLLMENTS_FILE, enrollments_data)
+                for enrollment in new_enrollments:
+                    add_enrollment_to_index(enrollments_index, enrollment)
+                    instructor_metrics.add_enrollment(enrollment)
+                sync_index('enrollments', ENROLLMENTS_FILE)
+                
+                increment_enrolled_count(course_id, len(new_enrollments))
+                
+                progress_index = get_progress_index()
+                progress_data = read_json_file(PROGRESS_FILE)
+                new_progress = [build_course_progress(new_user_id, course_id) for new_user_id in new_user_ids
+                                if course_id not in progress_index['by_user'].get(new_user_id, {})]
+                progress_data['progress'].extend(new_progress)
+                write_progress_file(progress_data, new_progress)
     
-    return jsonify({"message": "Successfully enrolled in the course"}), 201
+    return jsonify({
+        "message": f"Enrolled {len(new_user_ids)} students",
+        "enrolled": len(new_user_ids),
+        "results": results
+    }), 200
 
 @app.route('/api/courses/purchased', methods=['GET'])
 def get_purchased_courses():
@@ -306,52 +911,62 @@ def get_purchased_courses():
     if not user_id:
         return jsonify({"error": "Not authenticated"}), 401
     
-    enrollments_data = read_json_file(ENROLLMENTS_FILE)
-    enrolled_course_ids = [e['courseId'] for e in enrollments_data['enrollments'] if e['userId'] == user_id]
+    enrolled_course_ids = get_enrollments_index()['by_user'].get(user_id, {})
     
     courses_data = read_json_file(COURSES_FILE)
     enrolled_courses = [c for c in courses_data['courses'] if c['id'] in enrolled_course_ids]
     
     return jsonify(enrolled_courses), 200
 
-# Course Content and Progress
-def initialize_course_progress(user_id, course_id, course):
-    progress_data = read_json_file(PROGRESS_FILE)
-    
-    # Check if progress already exists
-    if any(p['userId'] == user_id and p['courseId'] == course_id for p in progress_data['progress']):
-        return
-    
-    # Initialize lecture completion status
-    completed_lectures = []
-    section_lecture_map = {}
-    
-    for s_index, section in enumerate(course.get('sections', [])):
-        for l_index, lecture in enumerate(section.get('lectures', [])):
-            lecture_id = f"{s_index}_{l_index}"
-            section_lecture_map[lecture_id] = {
-                'sectionIndex': s_index,
-                'lectureIndex': l_index,
-                'completed': False,
-                'notes': '',
-                'quiz_answers': {}
-            }
+@app.route('/api/courses/my-learning', methods=['GET'])
+def get_my_learning():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
     
-    # Create new progress entry
-    new_progress = {
-        'id': str(uuid.uuid4()),
-        'userId': user_id,
-        'courseId': course_id,
-        'completionPercentage': 0,
-        'lastWatchedSection': 0,
-        'lastWatchedLecture': 0,
-        'lectures': section_lecture_map,
-        'createdAt': datetime.now().isoformat(),
-        'updatedAt': datetime.now().isoformat()
-    }
+    user_enrollments = get_enrollments_index()['by_user'].get(user_id, {})
+    user_progress = get_progress_index()['by_user'].get(user_id, {})
+    courses_by_id = get_courses_index()['by_id']
     
-    progress_data['progress'].append(new_progress)
-    write_json_file(PROGRESS_FILE, progress_data)
+    # Join course headers with the user's progress, without the content tree
+    my_courses = []
+    for course_id, enrollment in user_enrollments.items():
+        course = courses_by_id.get(course_id)
+        if not course:
+            continue
+        
+        # Loaded through the engine so positions saved before a restructure
+        # point at the same lectures in the current layout
+        record = user_progress.get(course_id)
+        progress = progress_engine.load(record).fields if record else {}
+        header = {k: v for k, v in course.items() if k not in ['sections', 'annonces', 'reviews']}
+        header.update({
+            'enrolledAt': enrollment.get('enrolledAt'),
+            'completionPercentage': progress.get('completionPercentage', 0),
+            'lastWatchedSection': progress.get('lastWatchedSection', 0),
+            'lastWatchedLecture': progress.get('lastWatchedLecture', 0),
+            'lastActivity': progress.get('updatedAt')
+        })
+        my_courses.append(header)
+    
+    return jsonify(my_courses), 200
+
+# Course Content and Progress
+def initialize_course_progress(user_id, course_id):
+    with _data_lock:
+        progress_data = read_json_file(PROGRESS_FILE)
+        
+        # Check if progress already exists
+        if any(p['userId'] == user_id and p['courseId'] == course_id for p in progress_data['progress']):
+            return
+        
+        record = build_course_progress(user_id, course_id)
+        progress_data['progress'].append(record)
+        write_progress_file(progress_data, [record])
+
+def build_course_progress(user_id, course_id):
+    # Create new progress entry in the engine's compact form
+    return progress_engine.dump(progress_engine.create(user_id, course_id))
 
 @app.route('/api/courses/<course_id>/content', methods=['GET'])
 def get_course_content(course_id):
@@ -360,50 +975,45 @@ def get_course_content(course_id):
         return jsonify({"error": "Not authenticated"}), 401
     
     # Check if enrolled in this course
-    enrollments_data = read_json_file(ENROLLMENTS_FILE)
-    if not any(e['userId'] == user_id and e['courseId'] == course_id for e in enrollments_data['enrollments']):
+    if course_id not in get_enrollments_index()['by_user'].get(user_id, {}):
         return jsonify({"error": "Not enrolled in this course"}), 403
     
-    courses_data = read_json_file(COURSES_FILE)
-    course = next((c for c in courses_data['courses'] if c['id'] == course_id), None)
+    course = get_courses_index()['by_id'].get(course_id)
     
     if not course:
         return jsonify({"error": "Course not found"}), 404
     
     # Get progress data
-    progress_data = read_json_file(PROGRESS_FILE)
-    progress = next((p for p in progress_data['progress'] if p['userId'] == user_id and p['courseId'] == course_id), None)
+    record = get_progress_index()['by_user'].get(user_id, {}).get(course_id)
     
-    if not progress:
+    if not record:
         # Initialize progress
-        initialize_course_progress(user_id, course_id, course)
-        progress_data = read_json_file(PROGRESS_FILE)
-        progress = next((p for p in progress_data['progress'] if p['userId'] == user_id and p['courseId'] == course_id), None)
-    
-    # Create response with course content and progress
-    course_content = {
-        'id': course['id'],
-        'title': course['title'],
-        'sections': course.get('sections', []),
-        'annonces': course.get('annonces', []),
-        'reviews': course.get('reviews', []),
-        'completionPercentage': progress.get('completionPercentage', 0),
-        'lastWatchedSection': progress.get('lastWatchedSection', 0),
-        'lastWatchedLecture': progress.get('lastWatchedLecture', 0)
-    }
-    
-    # Update completion status for each lecture
-    for s_index, section in enumerate(course_content['sections']):
-        for l_index, lecture in enumerate(section['lectures']):
-            lecture_id = f"{s_index}_{l_index}"
-            if lecture_id in progress.get('lectures', {}):
-                lecture['completed'] = progress['lectures'][lecture_id]['completed']
-                lecture['notes'] = progress['lectures'][lecture_id].get('notes', '')
-            else:
-                lecture['completed'] = False
-                lecture['notes'] = ''
-    
-    return jsonify(course_content), 200
+        initialize_course_progress(user_id, course_id)
+        record = get_progress_index()['by_user'][user_id][course_id]
+    
+    progress = progress_engine.load(record)
+    sync_notes_layout(user_id, course_id)
+    notes = notes_store.get_course(user_id, course_id)
+    
+    # Per-user overlay: each lecture's completion bit, notes and first page of
+    # questions, then the completion percentage and last position
+    template = get_course_content_template(course)
+    fragments = template['fragments']
+    body = [fragments[0]]
+    for fragment, (s_index, l_index) in zip(fragments[1:], template['lectures']):
+        body.append('"completed": %s, "notes": %s, "qna": %s' % (
+            'true' if progress.is_completed(s_index, l_index) else 'false',
+            json.dumps(notes.get(f"{s_index}_{l_index}", '')),
+            json.dumps(qna_store.page(course_id, s_index, l_index, limit=QNA_PAGE_SIZE)[0])))
+        body.append(fragment)
+    body.append(json.dumps({
+        'completionPercentage': progress.fields.get('completionPercentage', 0),
+        'lastWatchedSection': progress.fields.get('lastWatchedSection', 0),
+        'lastWatchedLecture': progress.fields.get('lastWatchedLecture', 0)
+    })[1:-1])
+    body.append(fragments[-1])
+    
+    return app.response_class(''.join(body), mimetype='application/json'), 200
 
 @app.route('/api/courses/<course_id>/progress', methods=['GET'])
 def get_course_progress(course_id):
@@ -412,12 +1022,22 @@ def get_course_progress(course_id):
         return jsonify({"error": "Not authenticated"}), 401
     
     progress_data = read_json_file(PROGRESS_FILE)
-    progress = next((p for p in progress_data['progress'] if p['userId'] == user_id and p['courseId'] == course_id), None)
+    position, progress = find_progress(progress_data, user_id, course_id)
     
     if not progress:
         return jsonify({"error": "No progress found for this course"}), 404
     
-    return jsonify(progress), 200
+    # Polling clients pass the last version they saw and get only the lectures
+    # changed since then; a full record is returned if the change log is too short
+    since = request.args.get('since', type=int)
+    if since is not None:
+        delta = progress_engine.to_delta(progress, since)
+        if delta is not None:
+            return jsonify(delta), 200
+    
+    response = progress_engine.to_lectures_record(progress)
+    response.update(progress_engine.to_summary(progress))
+    return jsonify(response), 200
 
 @app.route('/api/courses/<course_id>/complete-lecture', methods=['POST'])
 def mark_lecture_completed(course_id):
@@ -432,42 +1052,28 @@ def mark_lecture_completed(course_id):
     if section_index is None or lecture_index is None:
         return jsonify({"error": "Section index and lecture index are required"}), 400
     
-    progress_data = read_json_file(PROGRESS_FILE)
-    progress = next((p for p in progress_data['progress'] if p['userId'] == user_id and p['courseId'] == course_id), None)
-    
-    if not progress:
-        return jsonify({"error": "No progress found for this course"}), 404
-    
-    lecture_id = f"{section_index}_{lecture_index}"
-    
-    if lecture_id not in progress['lectures']:
-        progress['lectures'][lecture_id] = {
-            'sectionIndex': section_index,
-            'lectureIndex': lecture_index,
-            'completed': False,
-            'notes': '',
-            'quiz_answers': {}
-        }
-    
-    progress['lectures'][lecture_id]['completed'] = True
-    progress['lastWatchedSection'] = section_index
-    progress['lastWatchedLecture'] = lecture_index
+    course = get_courses_index()['by_id'].get(course_id)
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
     
-    # Calculate completion percentage
-    courses_data = read_json_file(COURSES_FILE)
-    course = next((c for c in courses_data['courses'] if c['id'] == course_id), None)
+    if not lecture_exists(course, section_index, lecture_index):
+        return jsonify({"error": "Invalid section or lecture index"}), 400
     
-    if course:
-        total_lectures = sum(len(section.get('lectures', [])) for section in course.get('sections', []))
-        completed_lectures = sum(1 for l_id, l_data in progress['lectures'].items() if l_data['completed'])
+    with _data_lock:
+        progress_data = read_json_file(PROGRESS_FILE)
+        position, progress = find_progress(progress_data, user_id, course_id)
         
-        if total_lectures > 0:
-            progress['completionPercentage'] = int((completed_lectures / total_lectures) * 100)
-    
-    progress['updatedAt'] = datetime.now().isoformat()
-    write_json_file(PROGRESS_FILE, progress_data)
+        if not progress:
+            return jsonify({"error": "No progress found for this course"}), 404
+        
+        # Completion percentage is kept up to date by the engine
+        progress_engine.complete_lecture(progress, section_index, lecture_index)
+        progress_engine.touch(progress, section_index, lecture_index)
+        
+        save_progress(progress_data, position, progress)
+        write_progress_file(progress_data, [progress_data['progress'][position]])
     
-    return jsonify({"message": "Lecture marked as completed", "completionPercentage": progress['completionPercentage']}), 200
+    return jsonify({"message": "Lecture marked as completed", "completionPercentage": progress.fields['completionPercentage']}), 200
 
 @app.route('/api/courses/<course_id>/save-notes', methods=['POST'])
 def save_lecture_notes(course_id):
@@ -483,72 +1089,253 @@ def save_lecture_notes(course_id):
     if section_index is None or lecture_index is None:
         return jsonify({"error": "Section index and lecture index are required"}), 400
     
-    progress_data = read_json_file(PROGRESS_FILE)
-    progress = next((p for p in progress_data['progress'] if p['userId'] == user_id and p['courseId'] == course_id), None)
+    if not isinstance(notes, str):
+        return jsonify({"error": "Notes must be a string"}), 400
     
-    if not progress:
+    if course_id not in get_progress_index()['by_user'].get(user_id, {}):
         return jsonify({"error": "No progress found for this course"}), 404
     
-    lecture_id = f"{section_index}_{lecture_index}"
+    # Only this lecture's note file is rewritten; progress.json is untouched
+    try:
+        layout_version = sync_notes_layout(user_id, course_id)
+        size = notes_store.put(user_id, course_id, section_index, lecture_index, notes, layout_version)
+    except NotesLimitError as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    if lecture_id not in progress['lectures']:
-        progress['lectures'][lecture_id] = {
-            'sectionIndex': section_index,
-            'lectureIndex': lecture_index,
-            'completed': False,
-            'notes': '',
-            'quiz_answers': {}
-        }
+    return jsonify({"message": "Notes saved successfully", "size": size, "usage": notes_store.usage(user_id)}), 200
+
+@app.route('/api/courses/<course_id>/notes', methods=['GET'])
+def get_course_notes(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
     
-    progress['lectures'][lecture_id]['notes'] = notes
-    progress['updatedAt'] = datetime.now().isoformat()
-    write_json_file(PROGRESS_FILE, progress_data)
+    try:
+        sync_notes_layout(user_id, course_id)
+        notes = notes_store.get_course(user_id, course_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    return jsonify({"message": "Notes saved successfully"}), 200
+    return jsonify({"notes": notes, "totalBytes": notes_store.usage(user_id)['courses'].get(course_id, 0)}), 200
 
-@app.route('/api/courses/<course_id>/ask-question', methods=['POST'])
-def ask_lecture_question(course_id):
+@app.route('/api/courses/<course_id>/notes/<int:section_index>/<int:lecture_index>', methods=['GET'])
+def get_lecture_notes(course_id, section_index, lecture_index):
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({"error": "Not authenticated"}), 401
     
-    data = request.get_json()
-    section_index = data.get('sectionIndex')
-    lecture_index = data.get('lectureIndex')
-    question = data.get('question', '')
+    try:
+        sync_notes_layout(user_id, course_id)
+        notes = notes_store.get(user_id, course_id, section_index, lecture_index)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    if section_index is None or lecture_index is None or not question:
-        return jsonify({"error": "Section index, lecture index, and question are required"}), 400
+    return jsonify({"notes": notes, "size": len(notes.encode('utf-8'))}), 200
+
+@app.route('/api/notes/usage', methods=['GET'])
+def get_notes_usage():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
     
+    return jsonify(notes_store.usage(user_id)), 200
+
+# Gives lectures created before stable ids one, and records each course's
+# current lecture order as its first layout
+def assign_missing_lecture_ids():
     courses_data = read_json_file(COURSES_FILE)
-    course = next((c for c in courses_data['courses'] if c['id'] == course_id), None)
-    
-    if not course:
-        return jsonify({"error": "Course not found"}), 404
+    changed = False
     
-    if section_index >= len(course['sections']) or lecture_index >= len(course['sections'][section_index]['lectures']):
-        return jsonify({"error": "Invalid section or lecture index"}), 400
+    for position, course in enumerate(courses_data['courses']):
+        sections = assign_lecture_ids(course.get('sections', []))
+        if sections is not course.get('sections', []):
+            courses_data['courses'][position] = dict(course, sections=sections)
+            changed = True
     
-    # Add question to lecture
-    if 'qna' not in course['sections'][section_index]['lectures'][lecture_index]:
-        course['sections'][section_index]['lectures'][lecture_index]['qna'] = []
+    if changed:
+        write_json_file(COURSES_FILE, courses_data)
     
-    users_data = read_json_file(USERS_FILE)
-    user = next((u for u in users_data['users'] if u['id'] == user_id), None)
+    for course in courses_data['courses']:
+        if not course_layouts.current_version(course['id']):
+            course_layouts.record(course['id'], course.get('sections', []))
+
+# Moves notes still stored inside progress records into the notes store
+def migrate_progress_notes():
+    with _data_lock:
+        progress_data = read_json_file(PROGRESS_FILE)
+        migrated = False
+        
+        for position, record in enumerate(progress_data['progress']):
+            progress = progress_engine.load(record)
+            try:
+                layout_version = sync_notes_layout(progress.fields['userId'], progress.fields['courseId'])
+            except ValueError:
+                continue
+            moved = False
+            for lecture_position, notes in list(progress.notes.items()):
+                section_index, lecture_index = progress.indices(lecture_position)
+                try:
+                    notes_store.put(progress.fields['userId'], progress.fields['courseId'], section_index, lecture_index, notes, layout_version)
+                except ValueError:
+                    continue
+                del progress.notes[lecture_position]
+                moved = True
+            for entry in progress.overflow.values():
+                if not isinstance(entry, dict) or not isinstance(entry.get('notes'), str) or not entry['notes']:
+                    continue
+                try:
+                    notes_store.put(progress.fields['userId'], progress.fields['courseId'],
+                                    entry.get('sectionIndex'), entry.get('lectureIndex'), entry['notes'], layout_version)
+                except ValueError:
+                    continue
+                entry['notes'] = ''
+                moved = True
+            if moved:
+                save_progress(progress_data, position, progress)
+                migrated = True
+        
+        if migrated:
+            write_json_file(PROGRESS_FILE, progress_data)
+
+@app.route('/api/courses/<course_id>/ask-question', methods=['POST'])
+def ask_lecture_question(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
     
-    new_question = {
-        'id': len(course['sections'][section_index]['lectures'][lecture_index]['qna']) + 1,
-        'question': question,
-        'answer': "Pending instructor response...",
-        'askedBy': user['name'] if user else "Anonymous",
-        'askedAt': datetime.now().isoformat()
-    }
+    data = request.get_json()
+    section_index = data.get('sectionIndex')
+    lecture_index = data.get('lectureIndex')
+    question = data.get('question', '')
+    
+    if section_index is None or lecture_index is None or not question:
+        return jsonify({"error": "Section index, lecture index, and question are required"}), 400
+    
+    course = get_courses_index()['by_id'].get(course_id)
+    
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
+    
+    if not lecture_exists(course, section_index, lecture_index):
+        return jsonify({"error": "Invalid section or lecture index"}), 400
+    
+    user = get_users_index()['by_id'].get(user_id)
     
-    course['sections'][section_index]['lectures'][lecture_index]['qna'].append(new_question)
-    write_json_file(COURSES_FILE, courses_data)
+    # Appended to the Q&A log; courses.json is not rewritten
+    new_question = qna_store.ask(course_id, section_index, lecture_index, question,
+                                 user['name'] if user else "Anonymous", user_id)
     
     return jsonify(new_question), 201
 
+def lecture_exists(course, section_index, lecture_index):
+    # bool is an int subclass, so True/False would otherwise pass as 1/0
+    if isinstance(section_index, bool) or isinstance(lecture_index, bool):
+        return False
+    if not isinstance(section_index, int) or not isinstance(lecture_index, int) or section_index < 0 or lecture_index < 0:
+        return False
+    sections = course.get('sections', [])
+    return section_index < len(sections) and lecture_index < len(sections[section_index].get('lectures', []))
+
+@app.route('/api/courses/<course_id>/lectures/<int:section_index>/<int:lecture_index>/questions', methods=['GET'])
+def get_lecture_questions(course_id, section_index, lecture_index):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    # Cursor is the id of the last question of the previous page
+    after = request.args.get('after', 0, type=int)
+    limit = min(max(request.args.get('limit', QNA_PAGE_SIZE, type=int), 1), 100)
+    
+    questions, next_cursor = qna_store.page(course_id, section_index, lecture_index, after, limit)
+    
+    return jsonify({"questions": questions, "nextCursor": next_cursor}), 200
+
+@app.route('/api/courses/<course_id>/lectures/<int:section_index>/<int:lecture_index>/questions/similar', methods=['GET'])
+def suggest_similar_questions(course_id, section_index, lecture_index):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    text = request.args.get('q', '')
+    if not text.strip():
+        return jsonify({"error": "Query text is required"}), 400
+    
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 20)
+    
+    # Shown before posting so students can reuse an answered question
+    return jsonify({"similar": question_similarity.suggest(course_id, section_index, lecture_index, text, limit)}), 200
+
+@app.route('/api/courses/<course_id>/questions/<int:question_id>', methods=['PUT'])
+def update_lecture_question(course_id, question_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    question = qna_store.get(question_id)
+    
+    if not question or question['courseId'] != course_id:
+        return jsonify({"error": "Question not found"}), 404
+    
+    if question.get('askedById') != user_id:
+        return jsonify({"error": "Only the author can edit this question"}), 403
+    
+    text = (request.get_json() or {}).get('question')
+    if not text:
+        return jsonify({"error": "Question is required"}), 400
+    
+    return jsonify(qna_store.update(question_id, question=text)), 200
+
+@app.route('/api/courses/<course_id>/questions/<int:question_id>/answer', methods=['POST'])
+def answer_lecture_question(course_id, question_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    course = get_courses_index()['by_id'].get(course_id)
+    question = qna_store.get(question_id)
+    
+    if not course or not question or question['courseId'] != course_id:
+        return jsonify({"error": "Question not found"}), 404
+    
+    if course.get('instructorId') != user_id:
+        return jsonify({"error": "Only the instructor can answer questions"}), 403
+    
+    answer = (request.get_json() or {}).get('answer')
+    if not answer:
+        return jsonify({"error": "Answer is required"}), 400
+    
+    user = get_users_index()['by_id'].get(user_id)
+    answered = qna_store.update(question_id, answer=answer,
+                                answeredBy=user['name'] if user else course.get('instructor'),
+                                answeredAt=datetime.now().isoformat())
+    
+    return jsonify(answered), 200
+
+# Moves Q&A still stored on course lectures into the Q&A store
+def migrate_course_qna():
+    courses_data = read_json_file(COURSES_FILE)
+    questions = []
+    migrated = False
+    
+    for course in courses_data['courses']:
+        for s_index, section in enumerate(course.get('sections', [])):
+            for l_index, lecture in enumerate(section.get('lectures', [])):
+                if 'qna' not in lecture:
+                    continue
+                for item in lecture.pop('qna') or []:
+                    if not isinstance(item, dict) or not item.get('question'):
+                        continue
+                    question = {k: v for k, v in item.items() if k in ('question', 'answer', 'askedBy', 'askedAt')}
+                    question.update({'courseId': course['id'], 'sectionIndex': s_index, 'lectureIndex': l_index})
+                    questions.append(question)
+                migrated = True
+    
+    if migrated:
+        qna_store.add(questions)
+        write_json_file(COURSES_FILE, courses_data)
+
 @app.route('/api/courses/<course_id>/submit-quiz', methods=['POST'])
 def submit_quiz_answers(course_id):
     user_id = session.get('user_id')
@@ -559,56 +1346,150 @@ def submit_quiz_answers(course_id):
     section_index = data.get('sectionIndex')
     lecture_index = data.get('lectureIndex')
     answers = data.get('answers', {})
-    score = data.get('score', 0)
-    total_questions = data.get('totalQuestions', 0)
     
-    if section_index is None or lecture_index is None or not answers:
+    if section_index is None or lecture_index is None or not answers or not isinstance(answers, dict):
         return jsonify({"error": "Section index, lecture index, and answers are required"}), 400
     
-    progress_data = read_json_file(PROGRESS_FILE)
-    progress = next((p for p in progress_data['progress'] if p['userId'] == user_id and p['courseId'] == course_id), None)
+    course = get_courses_index()['by_id'].get(course_id)
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
     
-    if not progress:
-        return jsonify({"error": "No progress found for this course"}), 404
+    if not lecture_exists(course, section_index, lecture_index):
+        return jsonify({"error": "Invalid section or lecture index"}), 400
     
-    lecture_id = f"{section_index}_{lecture_index}"
+    # Any score sent by the client is ignored; answers are graded against the course's key
+    result = answer_keys.grade(course, section_index, lecture_index, answers)
+    if result is None:
+        return jsonify({"error": "This lecture has no quiz"}), 400
     
-    if lecture_id not in progress['lectures']:
-        progress['lectures'][lecture_id] = {
-            'sectionIndex': section_index,
-            'lectureIndex': lecture_index,
-            'completed': False,
-            'notes': '',
-            'quiz_answers': {}
-        }
+    with _data_lock:
+        progress_data = read_json_file(PROGRESS_FILE)
+        position, progress = find_progress(progress_data, user_id, course_id)
+        
+        if not progress:
+            return jsonify({"error": "No progress found for this course"}), 404
+        
+        # Marks the lecture as completed if the score is good enough (70% or better)
+        progress_engine.record_quiz(progress, section_index, lecture_index, answers, result['score'], result['totalQuestions'])
+        progress_engine.touch(progress)
+        save_progress(progress_data, position, progress)
+        write_progress_file(progress_data, [progress_data['progress'][position]])
+    quiz_attempts.append(build_attempt(user_id, course_id, answers, result))
     
-    progress['lectures'][lecture_id]['quiz_answers'] = answers
-    progress['lectures'][lecture_id]['quiz_score'] = score
-    progress['lectures'][lecture_id]['quiz_total'] = total_questions
+    return jsonify({
+        "message": "Quiz submitted successfully", 
+        "score": result['score'], 
+        "totalQuestions": result['totalQuestions'],
+        "passed": result['passed'],
+        "completionPercentage": progress.fields['completionPercentage']
+    }), 200
+
+@app.route('/api/courses/<course_id>/submit-quizzes', methods=['POST'])
+def submit_quiz_batch(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
     
-    # Mark as completed if score is good enough (e.g., 70% or better)
-    if total_questions > 0 and score / total_questions >= 0.7:
-        progress['lectures'][lecture_id]['completed'] = True
+    data = request.get_json() or {}
+    submissions = data.get('submissions')
+    
+    if not isinstance(submissions, list) or not submissions:
+        return jsonify({"error": "A list of submissions is required"}), 400
+    
+    for submission in submissions:
+        if not isinstance(submission, dict) or submission.get('sectionIndex') is None or \
+                submission.get('lectureIndex') is None or not isinstance(submission.get('answers'), dict):
+            return jsonify({"error": "Each submission needs a section index, lecture index, and answers"}), 400
+    
+    course = get_courses_index()['by_id'].get(course_id)
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
+    
+    for submission in submissions:
+        if not lecture_exists(course, submission['sectionIndex'], submission['lectureIndex']):
+            return jsonify({"error": "Invalid section or lecture index"}), 400
+    
+    with _data_lock:
+        progress_data = read_json_file(PROGRESS_FILE)
+        position, progress = find_progress(progress_data, user_id, course_id)
         
-        # Recalculate completion percentage
-        courses_data = read_json_file(COURSES_FILE)
-        course = next((c for c in courses_data['courses'] if c['id'] == course_id), None)
+        if not progress:
+            return jsonify({"error": "No progress found for this course"}), 404
         
-        if course:
-            total_lectures = sum(len(section.get('lectures', [])) for section in course.get('sections', []))
-            completed_lectures = sum(1 for l_id, l_data in progress['lectures'].items() if l_data['completed'])
-            
-            if total_lectures > 0:
-                progress['completionPercentage'] = int((completed_lectures / total_lectures) * 100)
+        # Grade the whole exam in one pass and record it with a single progress write
+        results = answer_keys.grade_batch(course, [
+            (submission['sectionIndex'], submission['lectureIndex'], submission['answers'])
+            for submission in submissions
+        ])
+        for submission, result in zip(submissions, results):
+            if result is not None:
+                progress_engine.record_quiz(progress, result['sectionIndex'], result['lectureIndex'],
+                                            submission['answers'], result['score'], result['totalQuestions'])
+        progress_engine.touch(progress)
+        save_progress(progress_data, position, progress)
+        write_progress_file(progress_data, [progress_data['progress'][position]])
+    quiz_attempts.extend([
+        build_attempt(user_id, course_id, submission['answers'], result)
+        for submission, result in zip(submissions, results) if result is not None
+    ])
     
-    progress['updatedAt'] = datetime.now().isoformat()
-    write_json_file(PROGRESS_FILE, progress_data)
+    return jsonify({
+        "message": "Quizzes submitted successfully",
+        "results": [
+            result if result is not None else {
+                "sectionIndex": submission['sectionIndex'],
+                "lectureIndex": submission['lectureIndex'],
+                "error": "This lecture has no quiz"
+            }
+            for submission, result in zip(submissions, results)
+        ],
+        "completionPercentage": progress.fields['completionPercentage']
+    }), 200
+
+@app.route('/api/courses/<course_id>/quiz-attempts', methods=['GET'])
+def get_quiz_attempts(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    section_index = request.args.get('sectionIndex', type=int)
+    lecture_index = request.args.get('lectureIndex', type=int)
+    
+    return jsonify(quiz_attempts.history(user_id, course_id, section_index, lecture_index)), 200
+
+@app.route('/api/courses/<course_id>/quiz-attempts/best', methods=['GET'])
+def get_best_quiz_scores(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    return jsonify(quiz_attempts.best_scores(user_id, course_id)), 200
+
+@app.route('/api/courses/<course_id>/leaderboard', methods=['GET'])
+def get_quiz_leaderboard(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    course = get_courses_index()['by_id'].get(course_id)
+    
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
+    
+    if course.get('instructorId') != user_id and course_id not in get_enrollments_index()['by_user'].get(user_id, {}):
+        return jsonify({"error": "Not enrolled in this course"}), 403
+    
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    
+    users_by_id = get_users_index()['by_id']
+    top = quiz_leaderboard.top(course_id, limit)
+    for entry in top:
+        entry['name'] = users_by_id.get(entry['userId'], {}).get('name')
     
     return jsonify({
-        "message": "Quiz submitted successfully", 
-        "score": score, 
-        "totalQuestions": total_questions,
-        "completionPercentage": progress['completionPercentage']
+        "top": top,
+        "me": quiz_leaderboard.rank(course_id, user_id),
+        "totalStudents": quiz_leaderboard.size(course_id)
     }), 200
 
 @app.route('/api/courses/<course_id>/track-progress', methods=['POST'])
@@ -625,46 +1506,80 @@ def track_video_progress(course_id):
     if section_index is None or lecture_index is None:
         return jsonify({"error": "Section index and lecture index are required"}), 400
     
-    progress_data = read_json_file(PROGRESS_FILE)
-    progress = next((p for p in progress_data['progress'] if p['userId'] == user_id and p['courseId'] == course_id), None)
+    if isinstance(progress_percent, bool) or not isinstance(progress_percent, (int, float)) or \
+            not 0 <= progress_percent <= 100:
+        return jsonify({"error": "progressPercent must be a number between 0 and 100"}), 400
     
-    if not progress:
-        return jsonify({"error": "No progress found for this course"}), 404
+    course = get_courses_index()['by_id'].get(course_id)
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
     
-    lecture_id = f"{section_index}_{lecture_index}"
+    if not lecture_exists(course, section_index, lecture_index):
+        return jsonify({"error": "Invalid section or lecture index"}), 400
     
-    if lecture_id not in progress['lectures']:
-        progress['lectures'][lecture_id] = {
-            'sectionIndex': section_index,
-            'lectureIndex': lecture_index,
-            'completed': False,
-            'notes': '',
-            'quiz_answers': {}
-        }
+    with _data_lock:
+        progress_data = read_json_file(PROGRESS_FILE)
+        position, progress = find_progress(progress_data, user_id, course_id)
+        
+        if not progress:
+            return jsonify({"error": "No progress found for this course"}), 404
+        
+        # Marks the lecture as completed if the video is watched to at least 90%
+        progress_engine.track_video(progress, section_index, lecture_index, progress_percent)
+        progress_engine.touch(progress, section_index, lecture_index)
+        
+        save_progress(progress_data, position, progress)
+        write_progress_file(progress_data, [progress_data['progress'][position]])
     
-    progress['lectures'][lecture_id]['video_progress'] = progress_percent
+    return jsonify({"message": "Progress tracked successfully"}), 200
+
+@app.route('/api/courses/continue-watching', methods=['GET'])
+def get_continue_watching():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 50)
     
-    # Mark as completed if video is watched to at least 90%
-    if progress_percent >= 90:
-        progress['lectures'][lecture_id]['completed'] = True
+    activity = get_recent_activity_index().get(user_id)
+    if not activity:
+        return jsonify([]), 200
+    
+    courses_by_id = get_courses_index()['by_id']
+    user_progress = get_progress_index()['by_user'].get(user_id, {})
+    feed = []
+    for updated_at, course_id in reversed(activity['order']):
+        if len(feed) >= limit:
+            break
         
-        # Recalculate completion percentage
-        courses_data = read_json_file(COURSES_FILE)
-        course = next((c for c in courses_data['courses'] if c['id'] == course_id), None)
+        course = courses_by_id.get(course_id)
+        record = user_progress.get(course_id)
+        if not course or not record:
+            continue
         
-        if course:
-            total_lectures = sum(len(section.get('lectures', [])) for section in course.get('sections', []))
-            completed_lectures = sum(1 for l_id, l_data in progress['lectures'].items() if l_data['completed'])
-            
-            if total_lectures > 0:
-                progress['completionPercentage'] = int((completed_lectures / total_lectures) * 100)
-    
-    progress['lastWatchedSection'] = section_index
-    progress['lastWatchedLecture'] = lecture_index
-    progress['updatedAt'] = datetime.now().isoformat()
-    write_json_file(PROGRESS_FILE, progress_data)
+        # The activity index only orders courses; positions and completion
+        # come from the record loaded in the course's current layout
+        position = progress_engine.load(record).fields
+        section_index = position.get('lastWatchedSection', 0)
+        lecture_index = position.get('lastWatchedLecture', 0)
+        
+        lecture = None
+        sections = course.get('sections', [])
+        if 0 <= section_index < len(sections) and 0 <= lecture_index < len(sections[section_index].get('lectures', [])):
+            lecture = sections[section_index]['lectures'][lecture_index]
+        
+        feed.append({
+            'courseId': course_id,
+            'title': course['title'],
+            'image': course.get('image', ''),
+            'completionPercentage': position.get('completionPercentage', 0),
+            'sectionIndex': section_index,
+            'lectureIndex': lecture_index,
+            'lectureTitle': lecture['title'] if lecture else None,
+            'lastActivity': updated_at
+        })
     
-    return jsonify({"message": "Progress tracked successfully"}), 200
+    return jsonify(feed), 200
 
 @app.route('/api/courses/<course_id>/certificate', methods=['GET'])
 def get_course_certificate(course_id):
@@ -688,6 +1603,168 @@ def get_course_certificate(course_id):
     
     return jsonify({"certificateUrl": certificate_url}), 200
 
+# Video heartbeats are coalesced in memory, keeping only the highest watermark
+# per lecture, and written to progress.json once per flush interval.
+_pending_heartbeats = {}
+_heartbeat_lock = threading.Lock()
+
+@app.route('/api/courses/<course_id>/heartbeat', methods=['POST'])
+def track_video_heartbeat(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    data = request.get_json() or {}
+    events = data.get('events', [])
+    
+    if not isinstance(events, list) or not events:
+        return jsonify({"error": "A list of events is required"}), 400
+    
+    structure = get_course_structure(course_id)
+    if not structure:
+        return jsonify({"error": "Course not found"}), 404
+    
+    # Validated up front: a bad value would otherwise fail the flush of every buffered heartbeat
+    lecture_counts = structure['sectionLectureCounts']
+    for event in events:
+        if not isinstance(event, dict) or not isinstance(event.get('sectionIndex'), int) or not isinstance(event.get('lectureIndex'), int):
+            return jsonify({"error": "Each event requires a section index and lecture index"}), 400
+        if not 0 <= event['sectionIndex'] < len(lecture_counts) or \
+                not 0 <= event['lectureIndex'] < lecture_counts[event['sectionIndex']]:
+            return jsonify({"error": "Lecture not found"}), 400
+        progress_percent = event.get('progressPercent', 0)
+        if isinstance(progress_percent, bool) or not isinstance(progress_percent, (int, float)) or \
+                not 0 <= progress_percent <= 100:
+            return jsonify({"error": "progressPercent must be a number between 0 and 100"}), 400
+    
+    with _heartbeat_lock:
+        pending = _pending_heartbeats.setdefault((user_id, course_id), {'lectures': {}, 'last': None})
+        for event in events:
+            section_index = event['sectionIndex']
+            lecture_index = event['lectureIndex']
+            progress_percent = event.get('progressPercent', 0)
+            timestamp = event.get('timestamp')
+            if not isinstance(timestamp, (int, float)):
+                timestamp = 0
+            
+            lecture_id = f"{section_index}_{lecture_index}"
+            watermark = pending['lectures'].get(lecture_id)
+            pending['lectures'][lecture_id] = progress_percent if watermark is None else max(watermark, progress_percent)
+            
+            if pending['last'] is None or timestamp >= pending['last'][2]:
+                pending['last'] = (section_index, lecture_index, timestamp)
+    
+    return jsonify({"message": "Heartbeat received", "accepted": len(events)}), 202
+
+def flush_heartbeats():
+    with _heartbeat_lock:
+        if not _pending_heartbeats:
+            return
+        pending_heartbeats = dict(_pending_heartbeats)
+        _pending_heartbeats.clear()
+    
+    with _data_lock:
+        progress_data = read_json_file(PROGRESS_FILE)
+        positions = {(p['userId'], p['courseId']): i for i, p in enumerate(progress_data['progress'])}
+        updated = []
+        
+        for key, pending in pending_heartbeats.items():
+            position = positions.get(key)
+            if position is None:
+                continue
+            
+            progress = progress_engine.load(progress_data['progress'][position])
+            for lecture_id, watermark in pending['lectures'].items():
+                section_index, lecture_index = (int(i) for i in lecture_id.split('_'))
+                watermark = max(progress.get_video_progress(section_index, lecture_index), watermark)
+                
+                # Marks the lecture as completed if the video is watched to at least 90%
+                progress_engine.track_video(progress, section_index, lecture_index, watermark)
+            
+            progress_engine.touch(progress, pending['last'][0], pending['last'][1])
+            save_progress(progress_data, position, progress)
+            updated.append(progress_data['progress'][position])
+        
+        if updated:
+            write_progress_file(progress_data, updated)
+
+def run_heartbeat_flusher():
+    while True:
+        time.sleep(HEARTBEAT_FLUSH_INTERVAL)
+        try:
+            flush_heartbeats()
+        except Exception as e:
+            app.logger.error(f"Failed to flush video heartbeats: {e}")
+
+threading.Thread(target=run_heartbeat_flusher, daemon=True).start()
+atexit.register(flush_heartbeats)
+
+# Background purge of deleted courses
+_course_purge_wakeup = threading.Event()
+
+def purge_course_batch(file_path, key, course_id, batch_size):
+    # Removes up to batch_size records of the course; returns the removed records
+    with _data_lock:
+        data = read_json_file(file_path)
+        kept = []
+        removed = []
+        for record in data[key]:
+            if record['courseId'] == course_id and len(removed) < batch_size:
+                removed.append(record)
+            else:
+                kept.append(record)
+        if removed:
+            data[key] = kept
+            write_json_file(file_path, data)
+        return removed
+
+def update_course_deletion(course_id, **fields):
+    with _data_lock:
+        deletions_data = read_json_file(COURSE_DELETIONS_FILE)
+        for deletion in deletions_data['deletions']:
+            if deletion['courseId'] == course_id and deletion['status'] != 'completed':
+                deletion.update(fields)
+                write_json_file(COURSE_DELETIONS_FILE, deletions_data)
+                return deletion
+
+def purge_deleted_courses():
+    deletions_data = read_json_file(COURSE_DELETIONS_FILE)
+    pending = [d for d in deletions_data['deletions'] if d['status'] != 'completed']
+    
+    for deletion in pending:
+        course_id = deletion['courseId']
+        enrollments_purged = deletion['enrollmentsPurged']
+        progress_purged = deletion['progressPurged']
+        update_course_deletion(course_id, status='purging')
+        
+        # Each batch is one short read-modify-write under the data lock, so
+        # requests can write the files between batches without losing updates
+        for file_path, key in ((ENROLLMENTS_FILE, 'enrollments'), (PROGRESS_FILE, 'progress')):
+            while True:
+                removed = purge_course_batch(file_path, key, course_id, COURSE_PURGE_BATCH_SIZE)
+                if not removed:
+                    break
+                if key == 'enrollments':
+                    enrollments_purged += len(removed)
+                    for enrollment in removed:
+                        notes_store.delete_course(enrollment['userId'], course_id)
+                else:
+                    progress_purged += len(removed)
+                update_course_deletion(course_id, enrollmentsPurged=enrollments_purged, progressPurged=progress_purged)
+        
+        update_course_deletion(course_id, status='completed', completedAt=datetime.now().isoformat())
+
+def run_course_purger():
+    while True:
+        _course_purge_wakeup.wait(COURSE_PURGE_INTERVAL)
+        _course_purge_wakeup.clear()
+        try:
+            purge_deleted_courses()
+        except Exception as e:
+            app.logger.error(f"Failed to purge deleted courses: {e}")
+
+threading.Thread(target=run_course_purger, daemon=True).start()
+
 # Search and catalog routes
 @app.route('/api/catalog/courses', methods=['GET'])
 def get_catalog_courses():
@@ -796,69 +1873,559 @@ def get_course_students(course_id):
     if course.get('instructorId') != user_id:
         return jsonify({"error": "Only the instructor can access student data"}), 403
     
-    enrollments_data = read_json_file(ENROLLMENTS_FILE)
-    enrolled_user_ids = [e['userId'] for e in enrollments_data['enrollments'] if e['courseId'] == course_id]
-    
-    users_data = read_json_file(USERS_FILE)
+    users_by_id = get_users_index()['by_id']
     enrolled_students = []
     
-    for user in users_data['users']:
-        if user['id'] in enrolled_user_ids:
+    for student_id, enrollment in get_enrollments_index()['by_course'].get(course_id, {}).items():
+        user = users_by_id.get(student_id)
+        if user:
             # Remove sensitive data
             enrolled_students.append({
                 'id': user['id'],
                 'name': user['name'],
                 'email': user['email'],
-                'enrolledAt': next((e['enrolledAt'] for e in enrollments_data['enrollments'] 
-                                    if e['userId'] == user['id'] and e['courseId'] == course_id), None)
+                'enrolledAt': enrollment.get('enrolledAt')
             })
     
     return jsonify(enrolled_students), 200
 
-@app.route('/api/metrics', methods=['GET'])
-def get_metrics():
+# Sorted roster keys per (course, sort field); see roster.py
+roster_cache = RosterCache()
+
+@on_course_change
+def invalidate_roster(course_id, course, paths):
+    if course is None:
+        roster_cache.invalidate(course_id)
+
+def get_roster_keys(course_id, sort):
+    # Rebuilt only when a file the sort value comes from was written, or for
+    # completion when the course's lectures were restructured
+    files = [ENROLLMENTS_FILE, USERS_FILE]
+    if sort == 'completion':
+        files.append(PROGRESS_FILE)
+    signature = tuple(_file_signature(file_path) for file_path in files)
+    if sort == 'completion':
+        signature += (course_layouts.current_version(course_id),)
+    
+    def build():
+        users_by_id = get_users_index()['by_id']
+        progress_by_user = get_progress_index()['by_user']
+        keys = []
+        for student_id, enrollment in get_enrollments_index()['by_course'].get(course_id, {}).items():
+            if student_id not in users_by_id:
+                continue
+            progress = progress_by_user.get(student_id, {}).get(course_id)
+            if sort == 'completion' and progress:
+                progress = progress_engine.load(progress).fields
+            keys.append((sort_value(sort, users_by_id[student_id], enrollment, progress), student_id))
+        return keys
+    
+    return roster_cache.keys(course_id, sort, signature, build)
+
+def roster_student(user, enrollment, progress):
+    # Loaded through the engine, so completion is counted against the course's
+    # current lectures rather than the layout the record was saved under
+    progress = progress_engine.load(progress).fields if progress else {}
+    return {
+        'id': user['id'],
+        'name': user['name'],
+        'email': user['email'],
+        'enrolledAt': enrollment.get('enrolledAt'),
+        'completionPercentage': progress.get('completionPercentage', 0),
+        'completedCount': progress.get('completedCount', 0),
+        'lastActivity': progress.get('updatedAt') or progress.get('lastActivity')
+    }
+
+@app.route('/api/courses/<course_id>/roster', methods=['GET'])
+def get_course_roster(course_id):
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({"error": "Not authenticated"}), 401
     
-    users_data = read_json_file(USERS_FILE)
-    user = next((u for u in users_data['users'] if u['id'] == user_id), None)
+    course = get_courses_index()['by_id'].get(course_id)
     
-    if not user or not user.get('isTeacher', False):
-        return jsonify({"error": "Only teachers can access metrics"}), 403
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
     
-    courses_data = read_json_file(COURSES_FILE)
-    instructor_courses = [c for c in courses_data['courses'] if c.get('instructorId') == user_id]
+    if course.get('instructorId') != user_id:
+        return jsonify({"error": "Only the instructor can access student data"}), 403
+    
+    sort = request.args.get('sort', 'name')
+    order = request.args.get('order', 'asc')
+    if sort not in ROSTER_SORT_FIELDS or order not in ('asc', 'desc'):
+        return jsonify({"error": f"sort must be one of {', '.join(ROSTER_SORT_FIELDS)} and order asc or desc"}), 400
+    
+    limit = request.args.get('limit', ROSTER_PAGE_SIZE, type=int)
+    if limit is None or not 1 <= limit <= MAX_ROSTER_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_ROSTER_PAGE_SIZE}"}), 400
+    
+    cursor = None
+    if request.args.get('cursor'):
+        try:
+            cursor = decode_cursor(request.args['cursor'], sort)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    
+    keys = get_roster_keys(course_id, sort)
+    users_by_id = get_users_index()['by_id']
+    
+    # Name/email filter, applied while walking the sorted keys
+    query = request.args.get('q', '').strip().lower()
+    matches = None
+    total = len(keys)
+    if query:
+        matches = lambda student_id: query in users_by_id[student_id]['name'].lower() or \
+            query in users_by_id[student_id]['email'].lower()
+        # Page counts follow the filter, so the matches are counted in full
+        total = sum(1 for _, student_id in keys if matches(student_id))
+    
+    page_keys, next_cursor = roster_page(keys, order == 'desc', cursor, limit, matches)
+    
+    # Only the students on this page are joined with their enrollment and progress
+    enrolled = get_enrollments_index()['by_course'].get(course_id, {})
+    progress_by_user = get_progress_index()['by_user']
+    students = [roster_student(users_by_id[student_id], enrolled.get(student_id, {}),
+                               progress_by_user.get(student_id, {}).get(course_id))
+                for _, student_id in page_keys]
+    
+    return jsonify({
+        "students": students,
+        "nextCursor": next_cursor,
+        "total": total
+    }), 200
+
+ROSTER_EXPORT_COLUMNS = ('id', 'name', 'email', 'enrolledAt', 'completionPercentage', 'completedCount',
+                         'lastActivity', 'quizScore', 'quizTotal', 'quizzesPassed')
+
+def roster_export_rows(course_id):
+    # Holds the indexes as they were when the export started and only a list
+    # of student ids; each row is built as the response asks for it
+    users_by_id = get_users_index()['by_id']
+    enrolled = get_enrollments_index()['by_course'].get(course_id, {})
+    progress_by_user = get_progress_index()['by_user']
+    
+    for student_id in list(enrolled):
+        user = users_by_id.get(student_id)
+        enrollment = enrolled.get(student_id)
+        if not user or not enrollment:
+            continue
+        row = roster_student(user, enrollment, progress_by_user.get(student_id, {}).get(course_id))
+        best_attempts = quiz_attempts.best_scores(student_id, course_id).values()
+        row['quizScore'] = sum(attempt.get('score', 0) for attempt in best_attempts)
+        row['quizTotal'] = sum(attempt.get('totalQuestions', 0) for attempt in best_attempts)
+        row['quizzesPassed'] = sum(1 for attempt in best_attempts if attempt.get('passed'))
+        yield row
+
+@app.route('/api/courses/<course_id>/roster/export', methods=['GET'])
+def export_course_roster(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
     
-    enrollments_data = read_json_file(ENROLLMENTS_FILE)
+    course = get_courses_index()['by_id'].get(course_id)
     
-    # Calculate metrics
-    total_courses = len(instructor_courses)
-    total_students = len(set(e['userId'] for e in enrollments_data['enrollments'] 
-                            if e['courseId'] in [c['id'] for c in instructor_courses]))
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
     
-    total_revenue = sum(c.get('price', 0) * sum(1 for e in enrollments_data['enrollments'] if e['courseId'] == c['id'])
-                      for c in instructor_courses)
+    if course.get('instructorId') != user_id:
+        return jsonify({"error": "Only the instructor can access student data"}), 403
     
-    # Get enrollments by month
-    enrollments_by_month = {}
-    for enrollment in enrollments_data['enrollments']:
-        if enrollment['courseId'] in [c['id'] for c in instructor_courses]:
-            date = enrollment['enrolledAt'].split('T')[0].rsplit('-', 1)[0]  # Format: YYYY-MM
-            enrollments_by_month[date] = enrollments_by_month.get(date, 0) + 1
-    
-    # Convert to array for chart data
-    enrollment_data = [{"date": date, "count": count} for date, count in enrollments_by_month.items()]
-    
-    metrics = {
-        'totalCourses': total_courses,
-        'totalStudents': total_students,
-        'totalRevenue': total_revenue,
-        'enrollmentData': sorted(enrollment_data, key=lambda x: x['date'])
+    export_format = request.args.get('format', 'csv')
+    if export_format == 'csv':
+        chunks = export_csv(roster_export_rows(course_id), ROSTER_EXPORT_COLUMNS)
+        mimetype = 'text/csv'
+    elif export_format == 'ndjson':
+        chunks = export_lines(roster_export_rows(course_id))
+        mimetype = 'application/x-ndjson'
+    else:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    
+    headers = {
+        'Content-Disposition': f'attachment; filename="roster-{course_id}.{export_format}"',
+        'Vary': 'Accept-Encoding'
     }
+    # Compressed while streaming when the client accepts it
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    
+    return app.response_class(chunks, mimetype=mimetype, headers=headers)
+
+# Per-course lecture funnels, keyed by course version
+_lecture_funnels = {}
+
+@on_course_change
+def invalidate_lecture_funnel(course_id, course, paths):
+    if course is None:
+        _lecture_funnels.pop(course_id, None)
+
+def get_lecture_funnel(course):
+    entry = _lecture_funnels.get(course['id'])
+    if entry is None or entry['version'] != course_version(course) or \
+            time.time() - entry['computedAt'] > LECTURE_FUNNEL_MAX_AGE:
+        course_id = course['id']
+        enrolled = get_enrollments_index()['by_course'].get(course_id, {})
+        progress_by_user = get_progress_index()['by_user']
+        records = (progress_by_user.get(student_id, {}).get(course_id) for student_id in enrolled)
+        progresses = [progress_engine.load(record) for record in records if record]
+        
+        structure = get_course_structure(course_id)
+        lectures = compute_funnel(progresses, structure['totalLectures'], len(enrolled))
+        position = 0
+        for s_index, section in enumerate(course.get('sections', [])):
+            for l_index, lecture in enumerate(section.get('lectures', [])):
+                lecture = lecture if isinstance(lecture, dict) else {}
+                lectures[position].update({
+                    'sectionIndex': s_index,
+                    'lectureIndex': l_index,
+                    'lectureId': lecture.get('id'),
+                    'title': lecture.get('title')
+                })
+                position += 1
+        
+        entry = {
+            'version': course_version(course),
+            'computedAt': time.time(),
+            'funnel': {
+                'courseId': course_id,
+                'version': course_version(course),
+                'students': len(enrolled),
+                'computedAt': datetime.now().isoformat(),
+                'lectures': lectures
+            }
+        }
+        _lecture_funnels[course_id] = entry
+    return entry['funnel']
+
+@app.route('/api/courses/<course_id>/funnel', methods=['GET'])
+def get_course_funnel(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    course = get_courses_index()['by_id'].get(course_id)
+    
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
+    
+    if course.get('instructorId') != user_id:
+        return jsonify({"error": "Only the instructor can access course analytics"}), 403
+    
+    return jsonify(get_lecture_funnel(course)), 200
+
+@app.route('/api/courses/<course_id>/quiz-analytics', methods=['GET'])
+def get_quiz_analytics(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    course = get_courses_index()['by_id'].get(course_id)
+    
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
+    
+    if course.get('instructorId') != user_id:
+        return jsonify({"error": "Only the instructor can access quiz analytics"}), 403
+    
+    stats = quiz_analytics.course_stats(course_id) or {}
+    
+    quizzes = []
+    for s_index, section in enumerate(course.get('sections', [])):
+        for l_index, lecture in enumerate(section.get('lectures', [])):
+            questions = (lecture.get('quiz') or {}).get('questions') or []
+            if not questions:
+                continue
+            quiz_stats = stats.get(f"{s_index}_{l_index}", {'submissions': 0, 'questions': []})
+            question_stats = quiz_stats['questions']
+            
+            question_entries = []
+            for q_index, question in enumerate(questions):
+                stat = question_stats[q_index] if q_index < len(question_stats) else {'attempts': 0, 'correct': 0, 'options': {}}
+                question_entries.append({
+                    'question': question.get('question'),
+                    'correctAnswer': question.get('correctAnswer'),
+                    'attempts': stat['attempts'],
+                    'correct': stat['correct'],
+                    'correctRate': round(stat['correct'] / stat['attempts'], 4) if stat['attempts'] else None,
+                    'options': stat['options']
+                })
+            
+            quizzes.append({
+                'sectionIndex': s_index,
+                'lectureIndex': l_index,
+                'lectureTitle': lecture.get('title'),
+                'submissions': quiz_stats['submissions'],
+                'questions': question_entries
+            })
+    
+    return jsonify({"courseId": course_id, "quizzes": quizzes}), 200
+
+@app.route('/api/courses/<course_id>/quiz-analytics/rebuild', methods=['POST'])
+def rebuild_quiz_analytics(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    course = get_courses_index()['by_id'].get(course_id)
+    
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
+    
+    if course.get('instructorId') != user_id:
+        return jsonify({"error": "Only the instructor can rebuild quiz analytics"}), 403
+    
+    # Recomputes the course's per-question aggregates from the attempt log in
+    # bulk, in the serving process so the next quiz-analytics read uses them
+    start = time.time()
+    quizzes = quiz_analytics.rebuild(course_id) or {}
+    
+    return jsonify({
+        "courseId": course_id,
+        "quizzes": len(quizzes),
+        "submissions": sum(quiz['submissions'] for quiz in quizzes.values()),
+        "seconds": round(time.time() - start, 3)
+    }), 200
+
+# Bulk NDJSON import and export of courses, enrollments and progress. Records
+# are exported in their stored form, so an export can be imported elsewhere
+# as-is. Import courses first, then enrollments, then progress.
+BULK_STORES = {
+    'courses': (COURSES_FILE, 'courses'),
+    'enrollments': (ENROLLMENTS_FILE, 'enrollments'),
+    'progress': (PROGRESS_FILE, 'progress')
+}
+
+def bulk_import(kind, lines, instructor_id=None):
+    # instructor_id limits the import to that instructor's courses (HTTP imports)
+    report = ImportReport(kind)
+    file_path, key = BULK_STORES[kind]
+    
+    # Each batch is validated and merged into a fresh read of the data file
+    # under the data lock, one write per batch: only one batch is held in
+    # memory, and records saved by requests between batches are kept
+    for batch in read_batches(lines, report):
+        with _data_lock:
+            users = get_users_index()['by_id']
+            courses = get_courses_index()['by_id']
+            enrolled = get_enrollments_index()['by_user']
+            deleted_course_ids = get_deleted_course_ids()
+            data = read_json_file(file_path)
+            if kind == 'courses':
+                existing = {course['id'] for course in data['courses']}
+            else:
+                existing = {(record['userId'], record['courseId']) for record in data[key]}
+            
+            imported = []
+            for line_number, record in batch:
+                if kind == 'courses':
+                    if not isinstance(record.get('id'), str) or not record['id'] or not record.get('title'):
+                        report.error(line_number, 'A course needs an id and a title')
+                        continue
+                    # A course that is being deleted is not brought back
+                    if record['id'] in existing or record['id'] in deleted_course_ids:
+                        report.skipped += 1
+                        continue
+                    if record.get('instructorId') not in users or \
+                            (instructor_id and record['instructorId'] != instructor_id):
+                        report.error(line_number, 'Unknown or foreign instructorId')
+                        continue
+                    if not isinstance(record.get('sections', []), list):
+                        report.error(line_number, 'Sections must be a list')
+                        continue
+                    # Enrollment counts are rebuilt as enrollments are imported
+                    record = dict(record, sections=assign_lecture_ids(record.get('sections', [])), enrolledCount=0)
+                    existing.add(record['id'])
+                else:
+                    user_id = record.get('userId')
+                    course = courses.get(record.get('courseId'))
+                    if user_id not in users or not course:
+                        report.error(line_number, 'Unknown userId or courseId')
+                        continue
+                    if instructor_id and course.get('instructorId') != instructor_id:
+                        report.error(line_number, 'Course belongs to another instructor')
+                        continue
+                    if (user_id, course['id']) in existing:
+                        report.skipped += 1
+                        continue
+                    
+                    if kind == 'enrollments':
+                        record = dict(record)
+                        record.setdefault('id', str(uuid.uuid4()))
+                        record.setdefault('enrolledAt', datetime.now().isoformat())
+                    else:
+                        if course['id'] not in enrolled.get(user_id, {}):
+                            report.error(line_number, 'User is not enrolled in the course')
+                            continue
+                        # Exports are written in the source's current layout, which is this course's current one
+                        record = dict(record, id=record.get('id') or str(uuid.uuid4()),
+                                      layoutVersion=course_layouts.current_version(course['id']))
+                        try:
+                            record = progress_engine.dump(progress_engine.load(record))
+                        except (KeyError, TypeError, ValueError, AttributeError):
+                            report.error(line_number, 'Invalid progress record')
+                            continue
+                    existing.add((user_id, course['id']))
+                imported.append(record)
+            
+            if imported:
+                data[key].extend(imported)
+                write_json_file(file_path, data)
+                report.imported += len(imported)
+                if kind == 'enrollments':
+                    new_counts = {}
+                    for enrollment in imported:
+                        new_counts[enrollment['courseId']] = new_counts.get(enrollment['courseId'], 0) + 1
+                    courses_data = read_json_file(COURSES_FILE)
+                    for course in courses_data['courses']:
+                        if course['id'] in new_counts:
+                            course['enrolledCount'] = course.get('enrolledCount', 0) + new_counts[course['id']]
+                    write_json_file(COURSES_FILE, courses_data)
+        
+        if kind == 'courses':
+            for course in imported:
+                course_layouts.record(course['id'], course['sections'])
+                instructor_metrics.course_changed(course)
+        elif kind == 'enrollments':
+            for enrollment in imported:
+                instructor_metrics.add_enrollment(enrollment)
+    
+    return report
+
+def bulk_export(kind, instructor_id=None):
+    file_path, key = BULK_STORES[kind]
+    records = read_json_file(file_path)[key]
+    if kind == 'progress':
+        # Brought up to date with the current lecture layout
+        records = (progress_engine.dump(progress_engine.load(record)) for record in records)
+    if instructor_id:
+        course_ids = {course_id for course_id, course in get_courses_index()['by_id'].items()
+                      if course.get('instructorId') == instructor_id}
+        records = (record for record in records
+                   if (record['id'] if kind == 'courses' else record['courseId']) in course_ids)
+    return export_lines(records)
+
+def print_import_report(report):
+    result = report.to_dict()
+    print(f"Imported {result['imported']} {result['kind']} ({result['skipped']} skipped, {result['errorCount']} errors) "
+          f"in {result['seconds']:.3f}s, {result['recordsPerSecond']} records/s")
+    for error in result['errors']:
+        print(f"  line {error['line']}: {error['error']}")
+
+@app.cli.command('import-ndjson')
+@click.argument('kind', type=click.Choice(list(BULK_STORES)))
+@click.argument('source', type=click.File('rb'), default='-')
+def import_ndjson_command(kind, source):
+    print_import_report(bulk_import(kind, source))
+
+@app.cli.command('export-ndjson')
+@click.argument('kind', type=click.Choice(list(BULK_STORES)))
+@click.argument('target', type=click.File('w'), default='-')
+def export_ndjson_command(kind, target):
+    start = time.time()
+    count = 0
+    for line in bulk_export(kind):
+        target.write(line)
+        count += 1
+    seconds = time.time() - start
+    print(f"Exported {count} {kind} in {seconds:.3f}s, {int(count / seconds) if seconds > 0 else count} records/s",
+          file=sys.stderr)
+
+def get_teacher(user_id):
+    user = get_users_index()['by_id'].get(user_id)
+    return user if user and user.get('isTeacher', False) else None
+
+@app.route('/api/import/<kind>', methods=['POST'])
+def import_ndjson(kind):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    if not get_teacher(user_id):
+        return jsonify({"error": "Only teachers can import data"}), 403
+    
+    if kind not in BULK_STORES:
+        return jsonify({"error": f"Unknown kind: {kind}"}), 404
+    
+    # The body is read line by line rather than parsed as one JSON document
+    report = bulk_import(kind, request.stream, instructor_id=user_id)
+    return jsonify(report.to_dict()), 200
+
+@app.route('/api/export/<kind>', methods=['GET'])
+def export_ndjson(kind):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
     
+    if not get_teacher(user_id):
+        return jsonify({"error": "Only teachers can export data"}), 403
+    
+    if kind not in BULK_STORES:
+        return jsonify({"error": f"Unknown kind: {kind}"}), 404
+    
+    return app.response_class(bulk_export(kind, instructor_id=user_id), mimetype='application/x-ndjson')
+
+@app.route('/api/metrics/rebuild', methods=['POST'])
+def rebuild_metrics():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    if not get_teacher(user_id):
+        return jsonify({"error": "Only teachers can rebuild metrics"}), 403
+    
+    # Recomputes the caller's dashboard totals from courses.json and
+    # enrollments.json, in the serving process so /api/metrics uses them;
+    # other instructors' totals are left alone
+    start = time.time()
+    instructor_metrics.rebuild(user_id)
+    
+    metrics = instructor_metrics.get(user_id)
+    metrics['seconds'] = round(time.time() - start, 3)
     return jsonify(metrics), 200
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    if not get_teacher(user_id):
+        return jsonify({"error": "Only teachers can access metrics"}), 403
+    
+    return jsonify(instructor_metrics.get(user_id)), 200
+
+@app.route('/api/metrics/timeseries', methods=['GET'])
+def get_metrics_timeseries():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    if not get_teacher(user_id):
+        return jsonify({"error": "Only teachers can access metrics"}), 403
+    
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in GRANULARITIES:
+        return jsonify({"error": f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+    
+    # Inclusive YYYY-MM-DD bounds; either defaults to the first or last day with data
+    start = parse_day(request.args['from']) if request.args.get('from') else None
+    end = parse_day(request.args['to']) if request.args.get('to') else None
+    if (request.args.get('from') and start is None) or (request.args.get('to') and end is None):
+        return jsonify({"error": "from and to must be dates (YYYY-MM-DD)"}), 400
+    if start is not None and end is not None and start > end:
+        return jsonify({"error": "from must not be after to"}), 400
+    
+    course_id = request.args.get('courseId')
+    try:
+        buckets = instructor_metrics.series(user_id, granularity, start, end, course_id, MAX_TIMESERIES_BUCKETS)
+    except (ValueError, OverflowError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if buckets is None:
+        return jsonify({"error": "Course not found"}), 404
+    
+    return jsonify({"granularity": granularity, "courseId": course_id, "buckets": buckets}), 200
+
 # Payment integration routes
 @app.route('/api/payment/create-checkout-session', methods=['POST'])
 def create_checkout_session():
@@ -882,29 +2449,35 @@ def create_checkout_session():
     # For now, just return a success response
     
     # Enroll user in the course
-    enrollments_data = read_json_file(ENROLLMENTS_FILE)
-    
-    # Check if already enrolled
-    if any(e['userId'] == user_id and e['courseId'] == course_id for e in enrollments_data['enrollments']):
-        return jsonify({"message": "Already enrolled in this course"}), 200
-    
-    # Create new enrollment
-    new_enrollment = {
-        'id': str(uuid.uuid4()),
-        'userId': user_id,
-        'courseId': course_id,
-        'enrolledAt': datetime.now().isoformat()
-    }
-    
-    enrollments_data['enrollments'].append(new_enrollment)
-    write_json_file(ENROLLMENTS_FILE, enrollments_data)
-    
-    # Increment enrolled count for the course
-    course['enrolledCount'] = course.get('enrolledCount', 0) + 1
-    write_json_file(COURSES_FILE, courses_data)
-    
-    # Initialize progress for this course
-    initialize_course_progress(user_id, course_id, course)
+    with _data_lock:
+        # The course may have been deleted since it was read; an enrollment
+        # added now would outlive the purge of its records
+        if course_id in get_deleted_course_ids():
+            return jsonify({"error": "Course not found"}), 404
+        
+        enrollments_data = read_json_file(ENROLLMENTS_FILE)
+        
+        # Check if already enrolled
+        if any(e['userId'] == user_id and e['courseId'] == course_id for e in enrollments_data['enrollments']):
+            return jsonify({"message": "Already enrolled in this course"}), 200
+        
+        # Create new enrollment
+        new_enrollment = {
+            'id': str(uuid.uuid4()),
+            'userId': user_id,
+            'courseId': course_id,
+            'enrolledAt': datetime.now().isoformat()
+        }
+        
+        enrollments_data['enrollments'].append(new_enrollment)
+        write_json_file(ENROLLMENTS_FILE, enrollments_data)
+        
+        # Increment enrolled count for the course
+        increment_enrolled_count(course_id)
+        
+        # Initialize progress for this course
+        initialize_course_progress(user_id, course_id)
+    instructor_metrics.add_enrollment(new_enrollment)
     
     return jsonify({
         "id": str(uuid.uuid4()),
@@ -969,7 +2542,6 @@ def initialize_demo_data():
                             'description': 'Introduction to Python and setting up your environment',
                             'videoUrl': 'https://sample-videos.com/video123/mp4/720/big_buck_bunny_720p_1mb.mp4',
                             'duration': 10,
-                            'qna': [],
                             'quiz': {
                                 'questions': [
                                     {
@@ -986,7 +2558,6 @@ def initialize_demo_data():
                             'description': 'Learn the basic syntax of Python',
                             'videoUrl': 'https://sample-videos.com/video123/mp4/720/big_buck_bunny_720p_1mb.mp4',
                             'duration': 15,
-                            'qna': [],
                             'quiz': {
                                 'questions': [
                                     {
@@ -1009,7 +2580,6 @@ def initialize_demo_data():
                             'description': 'Understanding lists and tuples in Python',
                             'videoUrl': 'https://sample-videos.com/video123/mp4/720/big_buck_bunny_720p_1mb.mp4',
                             'duration': 20,
-                            'qna': [],
                             'quiz': {
                                 'questions': [
                                     {
@@ -1083,7 +2653,6 @@ def initialize_demo_data():
                             'description': 'Learn the basics of React and its ecosystem',
                             'videoUrl': 'https://sample-videos.com/video123/mp4/720/big_buck_bunny_720p_1mb.mp4',
                             'duration': 15,
-                            'qna': [],
                             'quiz': {
                                 'questions': [
                                     {
@@ -1108,6 +2677,9 @@ def initialize_demo_data():
 
 # Initialize demo data on startup
 initialize_demo_data()
+assign_missing_lecture_ids()
+migrate_progress_notes()
+migrate_course_qna()
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -4,10 +4,17 @@ from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
 import os
+import sys
 import uuid
 from datetime import datetime, timedelta
 import random
 
+# The progress engine is shared with the top-level app.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from progress_engine import ProgressEngine
+from quiz_attempts import QuizAttemptLog, build_attempt
+from quiz_grading import AnswerKeyIndex
+
 app = Flask(__name__)
 CORS(app, supports_credentials=True, origins=["http://localhost:5173"])
 app.secret_key = 'your_secret_key_here'  # Change this to a secure random key in production
@@ -17,6 +24,8 @@ USERS_FILE = 'data/users.json'
 COURSES_FILE = 'data/courses.json'
 ENROLLMENTS_FILE = 'data/enrollments.json'
 PROGRESS_FILE = 'data/progress.json'
+QUIZ_ATTEMPTS_FILE = 'data/quiz_attempts.ndjson'
+# Superseded by QUIZ_ATTEMPTS_FILE; imported into the attempt log on first start
 QUIZ_RESULTS_FILE = 'data/quiz_results.json'
 
 # Create data directory if it doesn't exist
@@ -33,7 +42,6 @@ initialize_json_file(USERS_FILE, {'users': []})
 initialize_json_file(COURSES_FILE, {'courses': []})
 initialize_json_file(ENROLLMENTS_FILE, {'enrollments': []})
 initialize_json_file(PROGRESS_FILE, {'progress': []})
-initialize_json_file(QUIZ_RESULTS_FILE, {'quiz_results': []})
 
 # Helper functions to read and write data
 def read_json_file(file_path):
@@ -44,6 +52,50 @@ def write_json_file(file_path, data):
     with open(file_path, 'w') as f:
         json.dump(data, f, indent=4)
 
+# Courses by id, reloaded only when courses.json changes on disk
+_courses_cache = {'signature': None, 'by_id': {}}
+
+def get_course(course_id):
+    stat = os.stat(COURSES_FILE)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    if _courses_cache['signature'] != signature:
+        courses_data = read_json_file(COURSES_FILE)
+        _courses_cache['by_id'] = {course['id']: course for course in courses_data['courses']}
+        _courses_cache['signature'] = signature
+    return _courses_cache['by_id'].get(course_id)
+
+def get_section_lecture_counts(course_id):
+    course = get_course(course_id)
+    if not course:
+        return None
+    return [len(section.get('lectures', [])) for section in course.get('sections', [])]
+
+# Percentages are rounded and a passed quiz does not complete its lecture,
+# as before the engine was shared with app.py
+progress_engine = ProgressEngine(get_section_lecture_counts, round_percentage=True, quiz_completes_lecture=False)
+
+# Quiz answer keys compiled per course, used to grade submissions server-side.
+# Courses have no version here, so keys are recompiled when courses.json changes.
+answer_keys = AnswerKeyIndex(lambda course: _courses_cache['signature'])
+
+# Every graded attempt, appended one line at a time
+quiz_attempts = QuizAttemptLog(QUIZ_ATTEMPTS_FILE)
+if quiz_attempts.is_empty() and os.path.exists(QUIZ_RESULTS_FILE):
+    quiz_attempts.extend(read_json_file(QUIZ_RESULTS_FILE).get('quiz_results', []))
+
+def find_progress(progress_data, user_id, course_id):
+    # Returns the record's position in progress_data and the loaded progress
+    for position, record in enumerate(progress_data['progress']):
+        if record['userId'] == user_id and record['courseId'] == course_id:
+            return position, progress_engine.load(record)
+    return None, None
+
+def save_progress(progress_data, position, progress):
+    if position is None:
+        progress_data['progress'].append(progress_engine.dump(progress))
+    else:
+        progress_data['progress'][position] = progress_engine.dump(progress)
+
 # Health check endpoint
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -53,7 +105,7 @@ def health_check():
 
 # Course content and quiz submission route
 @app.route('/api/courses/<course_id>/submit-quiz', methods=['POST'])
-def submit_quiz():
+def submit_quiz(course_id):
     user_id = session.get('user_id')
     
     # Also accept token-based auth
@@ -66,92 +118,71 @@ def submit_quiz():
         return jsonify({"error": "Not authenticated"}), 401
     
     data = request.get_json()
-    course_id = data.get('courseId')
+    course_id = data.get('courseId', course_id)
     section_index = data.get('sectionIndex')
     lecture_index = data.get('lectureIndex')
     answers = data.get('answers', {})
-    score = data.get('score', 0)
-    total_questions = data.get('totalQuestions', 0)
     
-    if not course_id or section_index is None or lecture_index is None:
+    if not course_id or section_index is None or lecture_index is None or not isinstance(answers, dict):
         return jsonify({"error": "Missing required data"}), 400
     
-    # Read existing quiz results
-    quiz_data = read_json_file(QUIZ_RESULTS_FILE)
+    course = get_course(course_id)
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
     
-    # Add new quiz result
-    quiz_result = {
-        'id': str(uuid.uuid4()),
-        'userId': user_id,
-        'courseId': course_id,
-        'sectionIndex': section_index,
-        'lectureIndex': lecture_index,
-        'answers': answers,
-        'score': score,
-        'totalQuestions': total_questions,
-        'passed': score / total_questions >= 0.7,  # Pass if 70% or higher
-        'submittedAt': datetime.now().isoformat()
-    }
+    # Grade against the course's answer key rather than trusting a client score
+    result = answer_keys.grade(course, section_index, lecture_index, answers)
+    if result is None:
+        return jsonify({"error": "This lecture has no quiz"}), 400
+    score = result['score']
+    total_questions = result['totalQuestions']
     
-    quiz_data['quiz_results'].append(quiz_result)
-    write_json_file(QUIZ_RESULTS_FILE, quiz_data)
+    # Passed if 70% or higher; the attempt is appended to the log, not rewritten with it
+    quiz_result = quiz_attempts.append(build_attempt(user_id, course_id, answers, result))
     
     # Update user progress if passed
     if quiz_result['passed']:
         progress_data = read_json_file(PROGRESS_FILE)
         
-        # Find user's progress for this course
-        user_progress = None
-        for progress in progress_data['progress']:
-            if progress['userId'] == user_id and progress['courseId'] == course_id:
-                user_progress = progress
-                break
-        
-        # If no progress record exists, create one
+        # Find user's progress for this course, or create one
+        position, user_progress = find_progress(progress_data, user_id, course_id)
         if not user_progress:
-            user_progress = {
-                'id': str(uuid.uuid4()),
-                'userId': user_id,
-                'courseId': course_id,
-                'completedLectures': [],
-                'completedSections': [],
-                'quizzesPassed': [],
-                'lastActivity': datetime.now().isoformat()
-            }
-            progress_data['progress'].append(user_progress)
-        
-        # Add this quiz to passed quizzes if not already there
-        quiz_id = f"{section_index}_{lecture_index}"
-        if quiz_id not in user_progress.get('quizzesPassed', []):
-            if 'quizzesPassed' not in user_progress:
-                user_progress['quizzesPassed'] = []
-            user_progress['quizzesPassed'].append(quiz_id)
+            user_progress = progress_engine.create(user_id, course_id, lastActivity=datetime.now().isoformat())
         
-        # Check if all lectures in this section are completed
-        courses_data = read_json_file(COURSES_FILE)
-        for course in courses_data['courses']:
-            if course['id'] == course_id:
-                section = course['sections'][section_index]
-                all_section_lectures = [f"{section_index}_{i}" for i in range(len(section['lectures']))]
-                completed_lectures = [lec for lec in user_progress.get('completedLectures', []) 
-                                     if lec.startswith(f"{section_index}_")]
-                
-                # Mark section as completed if all lectures and quizzes are done
-                if len(completed_lectures) == len(all_section_lectures) and all(f"{section_index}_{i}" in user_progress.get('quizzesPassed', []) 
-                                                                             for i in range(len(section['lectures']))):
-                    if str(section_index) not in user_progress.get('completedSections', []):
-                        if 'completedSections' not in user_progress:
-                            user_progress['completedSections'] = []
-                        user_progress['completedSections'].append(str(section_index))
-                break
-        
-        user_progress['lastActivity'] = datetime.now().isoformat()
+        # Section completion is derived from the engine's per-section counters
+        progress_engine.record_quiz(user_progress, section_index, lecture_index, answers, score, total_questions)
+        progress_engine.touch(user_progress)
+        save_progress(progress_data, position, user_progress)
         write_json_file(PROGRESS_FILE, progress_data)
     
-    return jsonify({"message": "Quiz submitted successfully", "passed": quiz_result['passed']}), 200
+    return jsonify({
+        "message": "Quiz submitted successfully",
+        "passed": quiz_result['passed'],
+        "score": score,
+        "totalQuestions": total_questions
+    }), 200
+
+@app.route('/api/courses/<course_id>/quiz-attempts', methods=['GET'])
+def get_quiz_attempts(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    section_index = request.args.get('sectionIndex', type=int)
+    lecture_index = request.args.get('lectureIndex', type=int)
+    
+    return jsonify(quiz_attempts.history(user_id, course_id, section_index, lecture_index)), 200
+
+@app.route('/api/courses/<course_id>/quiz-attempts/best', methods=['GET'])
+def get_best_quiz_scores(course_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    return jsonify(quiz_attempts.best_scores(user_id, course_id)), 200
 
 @app.route('/api/courses/<course_id>/complete-lecture', methods=['POST'])
-def complete_lecture():
+def complete_lecture(course_id):
     user_id = session.get('user_id')
     
     # Also accept token-based auth
@@ -163,7 +194,6 @@ def complete_lecture():
     if not user_id and not token:
         return jsonify({"error": "Not authenticated"}), 401
     
-    course_id = request.view_args.get('course_id')
     data = request.get_json()
     section_index = data.get('sectionIndex')
     lecture_index = data.get('lectureIndex')
@@ -174,34 +204,14 @@ def complete_lecture():
     # Read existing progress
     progress_data = read_json_file(PROGRESS_FILE)
     
-    # Find user's progress for this course
-    user_progress = None
-    for progress in progress_data['progress']:
-        if progress['userId'] == user_id and progress['courseId'] == course_id:
-            user_progress = progress
-            break
-    
-    # If no progress record exists, create one
+    # Find user's progress for this course, or create one
+    position, user_progress = find_progress(progress_data, user_id, course_id)
     if not user_progress:
-        user_progress = {
-            'id': str(uuid.uuid4()),
-            'userId': user_id,
-            'courseId': course_id,
-            'completedLectures': [],
-            'completedSections': [],
-            'quizzesPassed': [],
-            'lastActivity': datetime.now().isoformat()
-        }
-        progress_data['progress'].append(user_progress)
+        user_progress = progress_engine.create(user_id, course_id, lastActivity=datetime.now().isoformat())
     
-    # Add this lecture to completed lectures if not already there
-    lecture_id = f"{section_index}_{lecture_index}"
-    if lecture_id not in user_progress.get('completedLectures', []):
-        if 'completedLectures' not in user_progress:
-            user_progress['completedLectures'] = []
-        user_progress['completedLectures'].append(lecture_id)
-    
-    user_progress['lastActivity'] = datetime.now().isoformat()
+    progress_engine.complete_lecture(user_progress, section_index, lecture_index)
+    progress_engine.touch(user_progress)
+    save_progress(progress_data, position, user_progress)
     write_json_file(PROGRESS_FILE, progress_data)
     
     return jsonify({"message": "Lecture marked as completed"}), 200
@@ -223,11 +233,7 @@ def get_course_progress(course_id):
     progress_data = read_json_file(PROGRESS_FILE)
     
     # Find user's progress for this course
-    user_progress = None
-    for progress in progress_data['progress']:
-        if progress['userId'] == user_id and progress['courseId'] == course_id:
-            user_progress = progress
-            break
+    position, user_progress = find_progress(progress_data, user_id, course_id)
     
     if not user_progress:
         return jsonify({
@@ -237,27 +243,11 @@ def get_course_progress(course_id):
             "completionPercentage": 0
         }), 200
     
-    # Calculate completion percentage
-    courses_data = read_json_file(COURSES_FILE)
-    course = None
-    for c in courses_data['courses']:
-        if c['id'] == course_id:
-            course = c
-            break
-    
-    if not course:
+    if get_section_lecture_counts(course_id) is None:
         return jsonify({"error": "Course not found"}), 404
     
-    total_lectures = sum(len(section['lectures']) for section in course['sections'])
-    completed_lectures = len(user_progress.get('completedLectures', []))
-    completion_percentage = (completed_lectures / total_lectures * 100) if total_lectures > 0 else 0
-    
-    return jsonify({
-        "completedLectures": user_progress.get('completedLectures', []),
-        "completedSections": user_progress.get('completedSections', []),
-        "quizzesPassed": user_progress.get('quizzesPassed', []),
-        "completionPercentage": round(completion_percentage)
-    }), 200
+    # Completion percentage is precomputed by the engine
+    return jsonify(progress_engine.to_summary(user_progress)), 200
 
 # ... keep existing code (course routes, enrollment routes, search, teacher dashboard, payment)
 
@@ -887,8 +877,6 @@ def initialize_demo_data():
         write_json_file(PROGRESS_FILE, progress_data)
         
         # Create some quiz results
-        quiz_data = read_json_file(QUIZ_RESULTS_FILE)
-        
         # Python course quizzes
         python_quiz1 = {
             'id': str(uuid.uuid4()),
@@ -942,8 +930,7 @@ def initialize_demo_data():
             'submittedAt': (datetime.now() - timedelta(days=10)).isoformat()
         }
         
-        quiz_data['quiz_results'] = [python_quiz1, python_quiz2, react_quiz1]
-        write_json_file(QUIZ_RESULTS_FILE, quiz_data)
+        quiz_attempts.extend([python_quiz1, python_quiz2, react_quiz1])
         
         print("Demo data initialized successfully")
 
@@ -0,0 +1,114 @@
+"""Streaming NDJSON import and export.
+
+Input is read one line at a time and handed to the importer in batches, so
+memory use depends on the batch size rather than on the size of the input.
+Exports are generators yielding NDJSON lines or CSV chunks, suitable both
+for writing to a file and for a streamed HTTP response, and gzip_chunks()
+compresses such a stream as it is produced.
+"""
+import csv
+import io
+import json
+import time
+import zlib
+
+BATCH_SIZE = 5000
+
+# CSV rows per yielded chunk
+CSV_CHUNK_ROWS = 500
+
+# Per-line errors kept in a report; later ones are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportReport:
+    """Counts and throughput of one import."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.imported = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors = []
+        self.started = time.time()
+
+    def error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def to_dict(self):
+        seconds = time.time() - self.started
+        records = self.imported + self.skipped + self.error_count
+        return {
+            'kind': self.kind,
+            'imported': self.imported,
+            'skipped': self.skipped,
+            'errorCount': self.error_count,
+            'errors': sorted(self.errors, key=lambda error: error['line']),
+            'seconds': round(seconds, 3),
+            'recordsPerSecond': int(records / seconds) if seconds > 0 else records
+        }
+
+
+def read_batches(lines, report, batch_size=BATCH_SIZE):
+    """Yield lists of (line_number, record) parsed from an iterable of lines.
+
+    Lines may be str or bytes; blank lines are ignored and lines that are not
+    a JSON object are recorded as errors on ``report``.
+    """
+    batch = []
+    for line_number, line in enumerate(lines, 1):
+        try:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            record = json.loads(line)
+        except ValueError:
+            report.error(line_number, 'Invalid JSON')
+            continue
+        if not isinstance(record, dict):
+            report.error(line_number, 'Each line must be a JSON object')
+            continue
+        batch.append((line_number, record))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_lines(records):
+    for record in records:
+        yield json.dumps(record) + '\n'
+
+
+def _csv_cell(value):
+    # Keeps spreadsheet apps from evaluating text such as "=HYPERLINK(...)"
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@'):
+        return "'" + value
+    return value
+
+
+def export_csv(rows, columns):
+    """Yield CSV text for dict rows, the header first, CSV_CHUNK_ROWS rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_csv_cell(row.get(column)) for column in columns])
+        if count % CSV_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
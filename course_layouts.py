@@ -0,0 +1,218 @@
+"""Stable lecture ids and the history of each course's lecture layout.
+
+Every lecture carries an ``id`` that survives reordering, while progress,
+notes, Q&A and quiz attempts are still stored under positional
+``"{section}_{lecture}"`` keys. Each time a course's lectures are added,
+removed or reordered a new layout version is appended to an NDJSON log
+together with a remap table holding only the positions that changed
+(old key -> new key, or None for a removed lecture). Data saved under an
+older layout is moved forward through those tables when it is next read, so
+restructuring a course never rewrites every student's records.
+
+Layout versions are immutable: a section whose lecture ids did not change
+shares its tuple with the previous version.
+"""
+import threading
+import uuid
+
+from ndjson_log import NdjsonLog
+
+
+def assign_lecture_ids(sections, previous_sections=None):
+    """Return ``sections`` with an id on every lecture.
+
+    Lectures that already have a unique id keep it. A lecture without one
+    takes the id of the lecture at the same position in ``previous_sections``
+    (so clients that do not send ids keep positional behavior), otherwise a
+    new one. Only sections and lectures that gain an id are copied, and
+    ``sections`` itself is returned when nothing changed.
+    """
+    if not isinstance(sections, list):
+        return sections
+
+    used = set()
+    for section in sections:
+        for lecture in _lectures(section):
+            if isinstance(lecture, dict) and isinstance(lecture.get('id'), str):
+                used.add(lecture['id'])
+
+    seen = set()
+    result = []
+    for s_index, section in enumerate(sections):
+        new_lectures = None
+        for l_index, lecture in enumerate(_lectures(section)):
+            if not isinstance(lecture, dict):
+                continue
+            lecture_id = lecture.get('id')
+            if isinstance(lecture_id, str) and lecture_id not in seen:
+                seen.add(lecture_id)
+                continue
+            # Missing or duplicated (e.g. a copied lecture)
+            lecture_id = _previous_id(previous_sections, s_index, l_index)
+            if lecture_id is None or lecture_id in used:
+                lecture_id = str(uuid.uuid4())
+            used.add(lecture_id)
+            seen.add(lecture_id)
+            if new_lectures is None:
+                new_lectures = list(section['lectures'])
+            new_lectures[l_index] = dict(lecture, id=lecture_id)
+        result.append(section if new_lectures is None else dict(section, lectures=new_lectures))
+    if all(new is old for new, old in zip(result, sections)):
+        return sections
+    return result
+
+
+def _lectures(section):
+    if not isinstance(section, dict) or not isinstance(section.get('lectures'), list):
+        return []
+    return section['lectures']
+
+
+def _previous_id(previous_sections, s_index, l_index):
+    try:
+        lecture_id = previous_sections[s_index]['lectures'][l_index].get('id')
+    except (TypeError, IndexError, KeyError, AttributeError):
+        return None
+    return lecture_id if isinstance(lecture_id, str) else None
+
+
+def lecture_layout(sections):
+    """Lecture ids per section, as a tuple of tuples."""
+    return tuple(tuple(lecture.get('id') if isinstance(lecture, dict) else None for lecture in _lectures(section))
+                 for section in sections or [])
+
+
+def _positions(layout):
+    return {lecture_id: f"{s_index}_{l_index}"
+            for s_index, lecture_ids in enumerate(layout)
+            for l_index, lecture_id in enumerate(lecture_ids) if lecture_id is not None}
+
+
+def diff_layouts(old_layout, new_layout):
+    """Remap table between two layouts: only lectures that moved or were removed."""
+    new_positions = _positions(new_layout)
+    remap = {}
+    for lecture_id, old_key in _positions(old_layout).items():
+        new_key = new_positions.get(lecture_id)
+        if new_key != old_key:
+            remap[old_key] = new_key
+    return remap
+
+
+class CourseLayouts:
+    """Layout versions per course, numbered from 1, persisted as NDJSON."""
+
+    def __init__(self, path):
+        self.lock = threading.RLock()
+        self._versions = {}
+        self._composed = {}
+        self._log = NdjsonLog(path, self._apply)
+        with self.lock:
+            self._log.catch_up()
+
+    def _apply(self, event):
+        versions = self._versions.setdefault(event['courseId'], [])
+        if event['layoutVersion'] != len(versions) + 1:
+            return
+        # Share unchanged sections with the previous version
+        previous = {section: section for section in versions[-1]['layout']} if versions else {}
+        layout = tuple(previous.get(tuple(ids), tuple(ids)) for ids in event['layout'])
+        versions.append({'layout': layout, 'remap': event.get('remap', {})})
+        self._composed.pop(event['courseId'], None)
+
+    def current_version(self, course_id):
+        """Latest layout version of the course, or 0 if none was recorded."""
+        with self.lock:
+            self._log.catch_up()
+            return len(self._versions.get(course_id, []))
+
+    def record(self, course_id, sections):
+        """Record the course's current lectures; returns the layout version."""
+        with self.lock:
+            self._log.catch_up()
+            versions = self._versions.get(course_id, [])
+            layout = lecture_layout(sections)
+            if versions and versions[-1]['layout'] == layout:
+                return len(versions)
+            self._log.append([{
+                'courseId': course_id,
+                'layoutVersion': len(versions) + 1,
+                'layout': [list(ids) for ids in layout],
+                'remap': diff_layouts(versions[-1]['layout'], layout) if versions else {}
+            }])
+            return len(self._versions[course_id])
+
+    def remap(self, course_id, from_version):
+        """Moves from ``from_version`` to the current layout, composed from
+        the per-version tables: {old key: current key or None}."""
+        with self.lock:
+            self._log.catch_up()
+            versions = self._versions.get(course_id, [])
+            cache = self._composed.setdefault(course_id, {})
+            if from_version in cache:
+                return cache[from_version]
+
+            composed = {}
+            for entry in versions[max(from_version, 0):]:
+                step = entry['remap']
+                for old_key, key in composed.items():
+                    if key is not None:
+                        composed[old_key] = step.get(key, key)
+                for old_key, key in step.items():
+                    if old_key not in composed:
+                        composed[old_key] = key
+            composed = {old_key: key for old_key, key in composed.items() if old_key != key}
+            cache[from_version] = composed
+            return composed
+
+
+class RecordPositions:
+    """Keeps the sectionIndex/lectureIndex of a store's records at their course's current layout.
+
+    Records carry the ``layoutVersion`` they were written under (1 if missing).
+    The store passes every record it indexes to track(), and calls sync()
+    before answering a query for a course: when the course was restructured
+    since, the course's records are moved in place and sync() returns True so
+    the store can rebuild its positional indexes for the course from
+    records(). Records whose lecture was removed get None positions.
+    """
+
+    def __init__(self, course_layouts):
+        self.course_layouts = course_layouts
+        self._records = {}
+        self._versions = {}
+        self._stale = set()
+
+    def stamp(self, record):
+        version = self.course_layouts.current_version(record.get('courseId'))
+        if version:
+            record.setdefault('layoutVersion', version)
+        return record
+
+    def track(self, record):
+        course_id = record.get('courseId')
+        self._records.setdefault(course_id, []).append(record)
+        version = record.get('layoutVersion', 1)
+        if self._versions.setdefault(course_id, version) != version:
+            self._stale.add(course_id)
+
+    def records(self, course_id):
+        return self._records.get(course_id, [])
+
+    def sync(self, course_id):
+        current = self.course_layouts.current_version(course_id)
+        if not current or (course_id not in self._stale and self._versions.get(course_id, current) == current):
+            return False
+        for record in self._records.get(course_id, []):
+            version = record.get('layoutVersion', 1)
+            if version == current:
+                continue
+            remap = self.course_layouts.remap(course_id, version)
+            key = f"{record.get('sectionIndex')}_{record.get('lectureIndex')}"
+            if key in remap:
+                record['sectionIndex'], record['lectureIndex'] = \
+                    (int(i) for i in remap[key].split('_')) if remap[key] is not None else (None, None)
+            record['layoutVersion'] = current
+        self._versions[course_id] = current
+        self._stale.discard(course_id)
+        return True
@@ -0,0 +1,162 @@
+"""Teacher dashboard aggregates kept up to date as enrollments and courses change.
+
+Each course contributes its enrollment count, enrolled students and daily
+enrollment and revenue series (see time_series.py) to its instructor's
+totals, and revenue is the sum of
+price x enrollments over the instructor's courses. Enrollments adjust those
+totals by one, a price change by (new - old) x enrollments, and a deleted
+course subtracts its whole contribution, so reading an instructor's metrics
+never scans enrollments. The aggregates are built from the data files on first
+use; updates that arrive before that are left to the build.
+
+Series revenue is counted at the course price when the enrollment is
+recorded (the current price for enrollments read by a rebuild).
+"""
+import threading
+
+from time_series import DailySeries, parse_day, rollup
+
+
+class InstructorMetrics:
+
+    def __init__(self, load):
+        # load() returns (courses, enrollments) for a full build
+        self.load = load
+        self.built = False
+        self._lock = threading.Lock()
+        self._courses = {}
+        self._instructors = {}
+
+    def _instructor(self, instructor_id):
+        metrics = self._instructors.get(instructor_id)
+        if metrics is None:
+            metrics = {'courses': set(), 'students': {}, 'revenue': 0, 'series': DailySeries()}
+            self._instructors[instructor_id] = metrics
+        return metrics
+
+    def rebuild(self, instructor_id=None):
+        """Rebuild from the data files; only one instructor's totals if given."""
+        # The files are read under the lock, so an enrollment recorded after
+        # the read waits for the swap and is then applied on top of it
+        with self._lock:
+            courses, enrollments = self.load()
+            if instructor_id is None or not self.built:
+                self._courses = {}
+                self._instructors = {}
+                for course in courses:
+                    self._add_course(course)
+                for enrollment in enrollments:
+                    self._add_enrollment(enrollment)
+                self.built = True
+                return
+
+            for course_id in list(self._instructor(instructor_id)['courses']):
+                self._remove_course(course_id)
+            del self._instructors[instructor_id]
+            course_ids = set()
+            for course in courses:
+                if course.get('instructorId') == instructor_id:
+                    # Drops a stale entry the course may have under another instructor
+                    self._remove_course(course['id'])
+                    self._add_course(course)
+                    course_ids.add(course['id'])
+            for enrollment in enrollments:
+                if enrollment['courseId'] in course_ids:
+                    self._add_enrollment(enrollment)
+
+    def _add_course(self, course):
+        self._courses[course['id']] = {
+            'instructorId': course.get('instructorId'),
+            'price': course.get('price', 0) or 0,
+            'students': set(),
+            'series': DailySeries()
+        }
+        self._instructor(course.get('instructorId'))['courses'].add(course['id'])
+
+    def _add_enrollment(self, enrollment):
+        course = self._courses.get(enrollment['courseId'])
+        if course is None or enrollment['userId'] in course['students']:
+            return
+        course['students'].add(enrollment['userId'])
+        metrics = self._instructor(course['instructorId'])
+        metrics['students'][enrollment['userId']] = metrics['students'].get(enrollment['userId'], 0) + 1
+        metrics['revenue'] += course['price']
+
+        day = parse_day(enrollment.get('enrolledAt'))
+        if day is not None:
+            course['series'].add(day, 1, course['price'])
+            metrics['series'].add(day, 1, course['price'])
+
+    def _contribute(self, course, sign):
+        # Adds (sign=1) or subtracts (sign=-1) a course's enrollments from its instructor's totals
+        metrics = self._instructor(course['instructorId'])
+        metrics['revenue'] += sign * course['price'] * len(course['students'])
+        for user_id in course['students']:
+            metrics['students'][user_id] = metrics['students'].get(user_id, 0) + sign
+            if not metrics['students'][user_id]:
+                del metrics['students'][user_id]
+        metrics['series'].merge(course['series'], sign)
+
+    def _remove_course(self, course_id):
+        course = self._courses.pop(course_id, None)
+        if course is not None:
+            self._contribute(course, -1)
+            self._instructor(course['instructorId'])['courses'].discard(course_id)
+
+    def add_enrollment(self, enrollment):
+        with self._lock:
+            if self.built:
+                self._add_enrollment(enrollment)
+
+    def course_changed(self, course):
+        """A course was created or its instructor or price may have changed."""
+        with self._lock:
+            if not self.built:
+                return
+            stored = self._courses.get(course['id'])
+            price = course.get('price', 0) or 0
+            if stored is None:
+                self._add_course(course)
+            elif stored['instructorId'] != course.get('instructorId'):
+                self._contribute(stored, -1)
+                self._instructor(stored['instructorId'])['courses'].discard(course['id'])
+                stored.update(instructorId=course.get('instructorId'), price=price)
+                self._instructor(stored['instructorId'])['courses'].add(course['id'])
+                self._contribute(stored, 1)
+            elif stored['price'] != price:
+                self._instructor(stored['instructorId'])['revenue'] += (price - stored['price']) * len(stored['students'])
+                stored['price'] = price
+
+    def course_removed(self, course_id):
+        with self._lock:
+            if self.built:
+                self._remove_course(course_id)
+
+    def get(self, instructor_id):
+        if not self.built:
+            self.rebuild()
+        with self._lock:
+            metrics = self._instructors.get(instructor_id)
+            if metrics is None:
+                return {'totalCourses': 0, 'totalStudents': 0, 'totalRevenue': 0, 'enrollmentData': []}
+            return {
+                'totalCourses': len(metrics['courses']),
+                'totalStudents': len(metrics['students']),
+                # Rounded to cents, since incremental updates accumulate float error
+                'totalRevenue': round(metrics['revenue'], 2),
+                'enrollmentData': [{'date': bucket['date'], 'count': bucket['enrollments']}
+                                   for bucket in rollup(metrics['series'], 'month')]
+            }
+
+    def series(self, instructor_id, granularity, start=None, end=None, course_id=None, max_buckets=None):
+        """Enrollment and revenue buckets for an instructor, or one of their courses."""
+        if not self.built:
+            self.rebuild()
+        with self._lock:
+            if course_id is not None:
+                course = self._courses.get(course_id)
+                if course is None or course['instructorId'] != instructor_id:
+                    return None
+                return rollup(course['series'], granularity, start, end, max_buckets)
+            metrics = self._instructors.get(instructor_id)
+            return rollup(metrics['series'], granularity, start, end, max_buckets) if metrics else []
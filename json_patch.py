@@ -0,0 +1,145 @@
+"""JSON Patch (RFC 6902) operations for course documents.
+
+apply_patch() never mutates the document it is given: containers along each
+changed path are copied and everything else is shared with the original, so
+the old version stays valid for readers that still hold it.
+"""
+import copy
+
+
+class JsonPatchError(ValueError):
+    pass
+
+
+class JsonPatchTestFailed(JsonPatchError):
+    """A ``test`` operation did not match."""
+
+
+def parse_pointer(pointer):
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith('/')):
+        raise JsonPatchError(f'Invalid JSON pointer: {pointer!r}')
+    if pointer == '':
+        return []
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def _list_index(container, token, allow_end=False):
+    if token == '-' and allow_end:
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith('0')):
+        raise JsonPatchError(f'Invalid list index: {token!r}')
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f'List index out of range: {token}')
+    return index
+
+
+def _child(container, token):
+    if isinstance(container, dict):
+        if token not in container:
+            raise JsonPatchError(f'Path not found: {token!r}')
+        return container[token]
+    if isinstance(container, list):
+        return container[_list_index(container, token)]
+    raise JsonPatchError(f'Cannot traverse into {type(container).__name__}')
+
+
+def get_value(document, tokens):
+    for token in tokens:
+        document = _child(document, token)
+    return document
+
+
+def _update(document, tokens, change):
+    # Copies the containers on the path to the parent and lets change() edit the copy
+    if not tokens:
+        raise JsonPatchError('Operations on the whole document are not supported')
+    if isinstance(document, dict):
+        document = dict(document)
+    elif isinstance(document, list):
+        document = list(document)
+    else:
+        raise JsonPatchError(f'Cannot traverse into {type(document).__name__}')
+
+    if len(tokens) == 1:
+        change(document, tokens[0])
+    elif isinstance(document, dict):
+        document[tokens[0]] = _update(_child(document, tokens[0]), tokens[1:], change)
+    else:
+        index = _list_index(document, tokens[0])
+        document[index] = _update(document[index], tokens[1:], change)
+    return document
+
+
+def _add(document, tokens, value):
+    def change(container, token):
+        if isinstance(container, dict):
+            container[token] = value
+        else:
+            container.insert(_list_index(container, token, allow_end=True), value)
+    return _update(document, tokens, change)
+
+
+def _remove(document, tokens):
+    def change(container, token):
+        if isinstance(container, dict):
+            if token not in container:
+                raise JsonPatchError(f'Path not found: {token!r}')
+            del container[token]
+        else:
+            del container[_list_index(container, token)]
+    return _update(document, tokens, change)
+
+
+def _replace(document, tokens, value):
+    def change(container, token):
+        if isinstance(container, dict):
+            if token not in container:
+                raise JsonPatchError(f'Path not found: {token!r}')
+            container[token] = value
+        else:
+            container[_list_index(container, token)] = value
+    return _update(document, tokens, change)
+
+
+def apply_patch(document, operations):
+    """Return (patched_document, changed_paths) for a list of operations."""
+    if not isinstance(operations, list):
+        raise JsonPatchError('A patch must be a list of operations')
+
+    changed_paths = []
+    for operation in operations:
+        if not isinstance(operation, dict) or 'op' not in operation or 'path' not in operation:
+            raise JsonPatchError('Each operation needs an "op" and a "path"')
+        op = operation['op']
+        tokens = parse_pointer(operation['path'])
+
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise JsonPatchError(f'"{op}" needs a "value"')
+
+        if op == 'add':
+            document = _add(document, tokens, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            document = _remove(document, tokens)
+        elif op == 'replace':
+            document = _replace(document, tokens, copy.deepcopy(operation['value']))
+        elif op in ('move', 'copy'):
+            from_tokens = parse_pointer(operation.get('from'))
+            if op == 'move' and tokens[:len(from_tokens)] == from_tokens and tokens != from_tokens:
+                raise JsonPatchError('Cannot move a value into itself')
+            value = get_value(document, from_tokens)
+            if op == 'move':
+                document = _remove(document, from_tokens)
+                changed_paths.append(operation['from'])
+            else:
+                value = copy.deepcopy(value)
+            document = _add(document, tokens, value)
+        elif op == 'test':
+            if get_value(document, tokens) != operation['value']:
+                raise JsonPatchTestFailed(f'Test failed at {operation["path"]}')
+            continue
+        else:
+            raise JsonPatchError(f'Unsupported operation: {op!r}')
+        changed_paths.append(operation['path'])
+
+    return document, changed_paths
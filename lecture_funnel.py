@@ -0,0 +1,97 @@
+"""Lecture drop-off funnels for instructors.
+
+A student "reached" a lecture if they completed it or watched part of its
+video, or reached any later lecture. From the students x lectures completion
+matrix (unpacked straight from the progress bitmaps) and the matching matrix
+of video positions, the funnel gives each lecture's reach, completions,
+median video position among students who reached it, and drop-off: the share
+of students who reached the lecture but went no further. Uses NumPy when it
+is installed, falling back to plain Python otherwise.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _funnel_numpy(progresses, lecture_count):
+    student_count = len(progresses)
+    width = (lecture_count + 7) // 8
+    bits = np.frombuffer(b''.join(bytes(progress.completed.bits) for progress in progresses),
+                         dtype=np.uint8).reshape(student_count, width)
+    completed = np.unpackbits(bits, axis=1, bitorder='little')[:, :lecture_count].astype(bool)
+    video = np.zeros((student_count, lecture_count), dtype=np.float64)
+    for row, progress in enumerate(progresses):
+        for position, value in progress.video.items():
+            if position < lecture_count and isinstance(value, (int, float)):
+                video[row, position] = value
+
+    active = completed | (video > 0)
+    # Furthest lecture each student was active on, -1 for none
+    furthest = np.where(active.any(axis=1), lecture_count - 1 - np.argmax(active[:, ::-1], axis=1), -1)
+    furthest_counts = np.bincount(furthest + 1, minlength=lecture_count + 1)
+    reached = furthest_counts[::-1].cumsum()[::-1][1:]
+    completions = completed.sum(axis=0)
+
+    # Median video position over the students who reached each lecture
+    medians = np.zeros(lecture_count)
+    columns = np.nonzero(reached)[0]
+    if len(columns):
+        masked = np.where(np.arange(lecture_count) <= furthest[:, None], video, np.nan)
+        medians[columns] = np.nanmedian(masked[:, columns], axis=0)
+    return reached.tolist(), completions.tolist(), medians.tolist()
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def _funnel_python(progresses, lecture_count):
+    reached = [0] * lecture_count
+    completions = [0] * lecture_count
+    positions = [[] for _ in range(lecture_count)]
+    for progress in progresses:
+        video = {position: value for position, value in progress.video.items()
+                 if position < lecture_count and isinstance(value, (int, float))}
+        completed = [position for position in progress.completed if position < lecture_count]
+        active = [position for position, value in video.items() if value > 0] + completed
+        furthest = max(active, default=-1)
+        for position in completed:
+            completions[position] += 1
+        for position in range(furthest + 1):
+            reached[position] += 1
+            positions[position].append(video.get(position, 0))
+    medians = [_median(values) if values else 0 for values in positions]
+    return reached, completions, medians
+
+
+def compute_funnel(progresses, lecture_count, student_count=None):
+    """Per-lecture reach, completions, median video position and drop-off.
+
+    ``progresses`` are progress_model.CourseProgress objects loaded against
+    the course's current structure of ``lecture_count`` lectures;
+    ``student_count`` (default: one per progress) is the base of reachRate.
+    """
+    if student_count is None:
+        student_count = len(progresses)
+    if not lecture_count or not progresses:
+        reached, completions, medians = [0] * lecture_count, [0] * lecture_count, [0] * lecture_count
+    elif np is not None:
+        reached, completions, medians = _funnel_numpy(progresses, lecture_count)
+    else:
+        reached, completions, medians = _funnel_python(progresses, lecture_count)
+
+    lectures = []
+    for position in range(lecture_count):
+        # Past the last lecture, "going further" means completing it
+        further = reached[position + 1] if position + 1 < lecture_count else completions[position]
+        lectures.append({
+            'reached': int(reached[position]),
+            'reachRate': round(reached[position] / student_count, 4) if student_count else 0,
+            'completed': int(completions[position]),
+            'medianVideoProgress': round(float(medians[position]), 1),
+            'dropOff': round((reached[position] - further) / reached[position], 4) if reached[position] else 0
+        })
+    return lectures
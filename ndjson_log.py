@@ -0,0 +1,66 @@
+"""Append-only files of JSON objects, one per line.
+
+Used by the quiz attempt log and the Q&A store. Records are only ever
+appended, so a writer never rewrites earlier records and a reader only has to
+parse what was added since its last read. Locking within a process is left
+to the owner; exclusive() serializes writers across processes where the
+platform has flock().
+"""
+import json
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class NdjsonLog:
+    """``on_record(record)`` is called for every record read or appended, in file order."""
+
+    def __init__(self, path, on_record):
+        self.path = path
+        self.on_record = on_record
+        self.offset = 0
+        if not os.path.exists(path):
+            open(path, 'a').close()
+
+    def catch_up(self):
+        # Index complete lines written since the last read, including those of
+        # other processes; a torn last line is left for the next call
+        if os.path.getsize(self.path) == self.offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        # Advanced first, so an on_record callback that reads the log again
+        # does not index the same lines a second time
+        self.offset += end
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                self.on_record(record)
+
+    @contextmanager
+    def exclusive(self):
+        # Held around a catch_up() and the append() that depends on it, so
+        # another process cannot append in between
+        with open(self.path, 'ab') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def append(self, records):
+        # Another process may append between our last read and this write, so
+        # the new records are indexed by reading them back in file order
+        data = b''.join((json.dumps(record) + '\n').encode('utf-8') for record in records)
+        with open(self.path, 'ab') as f:
+            f.write(data)
+        self.catch_up()
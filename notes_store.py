@@ -0,0 +1,200 @@
+"""Lecture notes kept outside of progress.json.
+
+Each (user, course, lecture) note is its own file under
+``<root>/<user_id>/<course_id>/<section>_<lecture>.txt``, so saving a note
+rewrites only that note and progress records stay small regardless of how
+much a student writes. Byte usage per user and per course is tracked in
+memory, filled from the directory listing the first time a user is touched.
+
+A course directory may hold a ``layout`` file with the course layout version
+(see course_layouts.py) its file names refer to; sync_layout() renames the
+notes of lectures that moved since then.
+"""
+import os
+import re
+import shutil
+import threading
+
+# Limits on note sizes in UTF-8 bytes
+MAX_NOTE_BYTES = 64 * 1024
+MAX_USER_NOTES_BYTES = 5 * 1024 * 1024
+
+_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+_LECTURE_FILE_PATTERN = re.compile(r'^(\d+)_(\d+)\.txt$')
+_LAYOUT_FILE = 'layout'
+
+
+class NotesLimitError(ValueError):
+    """A note would exceed MAX_NOTE_BYTES or the user's quota."""
+
+
+class NotesStore:
+
+    def __init__(self, root):
+        self.root = root
+        self._usage = {}
+        self._layout_versions = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _course_dir(self, user_id, course_id):
+        # Ids end up in paths, so refuse anything that is not a plain token
+        if not _ID_PATTERN.match(str(user_id)) or not _ID_PATTERN.match(str(course_id)):
+            raise ValueError('Invalid user or course id')
+        return os.path.join(self.root, user_id, course_id)
+
+    def _note_path(self, user_id, course_id, section_index, lecture_index):
+        if not isinstance(section_index, int) or not isinstance(lecture_index, int) or \
+                section_index < 0 or lecture_index < 0:
+            raise ValueError('Section and lecture indexes must be non-negative integers')
+        return os.path.join(self._course_dir(user_id, course_id), f"{section_index}_{lecture_index}.txt")
+
+    def _user_usage(self, user_id):
+        usage = self._usage.get(user_id)
+        if usage is None:
+            usage = {'totalBytes': 0, 'noteCount': 0, 'courses': {}}
+            user_dir = os.path.join(self.root, user_id)
+            if os.path.isdir(user_dir):
+                for course_id in os.listdir(user_dir):
+                    for entry in os.scandir(os.path.join(user_dir, course_id)):
+                        if _LECTURE_FILE_PATTERN.match(entry.name):
+                            size = entry.stat().st_size
+                            usage['totalBytes'] += size
+                            usage['noteCount'] += 1
+                            usage['courses'][course_id] = usage['courses'].get(course_id, 0) + size
+            self._usage[user_id] = usage
+        return usage
+
+    def get(self, user_id, course_id, section_index, lecture_index):
+        path = self._note_path(user_id, course_id, section_index, lecture_index)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return ''
+
+    def get_course(self, user_id, course_id):
+        # {"<section>_<lecture>": notes} for every lecture of the course with notes
+        course_dir = self._course_dir(user_id, course_id)
+        if not os.path.isdir(course_dir):
+            return {}
+        notes = {}
+        for name in os.listdir(course_dir):
+            match = _LECTURE_FILE_PATTERN.match(name)
+            if match:
+                with open(os.path.join(course_dir, name), 'r', encoding='utf-8') as f:
+                    notes[f"{match.group(1)}_{match.group(2)}"] = f.read()
+        return notes
+
+    def put(self, user_id, course_id, section_index, lecture_index, notes, layout_version=None):
+        """Store a note (an empty note deletes it) and return its size in bytes.
+
+        ``layout_version`` is recorded for the course directory if it has none yet.
+        """
+        path = self._note_path(user_id, course_id, section_index, lecture_index)
+        data = notes.encode('utf-8')
+        if len(data) > MAX_NOTE_BYTES:
+            raise NotesLimitError(f'Notes are limited to {MAX_NOTE_BYTES} bytes per lecture')
+
+        with self._lock:
+            usage = self._user_usage(user_id)
+            try:
+                previous_size = os.path.getsize(path)
+            except FileNotFoundError:
+                previous_size = None
+            if usage['totalBytes'] - (previous_size or 0) + len(data) > MAX_USER_NOTES_BYTES:
+                raise NotesLimitError(f'Notes are limited to {MAX_USER_NOTES_BYTES} bytes per user')
+
+            if data:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                layout_path = os.path.join(os.path.dirname(path), _LAYOUT_FILE)
+                if layout_version is not None and not os.path.exists(layout_path):
+                    self._write_layout_version(user_id, course_id, layout_version)
+                temp_path = path + '.tmp'
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            elif previous_size is not None:
+                os.remove(path)
+
+            delta = len(data) - (previous_size or 0)
+            usage['totalBytes'] += delta
+            usage['noteCount'] += (1 if data else 0) - (1 if previous_size is not None else 0)
+            course_bytes = usage['courses'].get(course_id, 0) + delta
+            if course_bytes:
+                usage['courses'][course_id] = course_bytes
+            else:
+                usage['courses'].pop(course_id, None)
+        return len(data)
+
+    def _write_layout_version(self, user_id, course_id, layout_version):
+        with open(os.path.join(self._course_dir(user_id, course_id), _LAYOUT_FILE), 'w') as f:
+            f.write(str(layout_version))
+        self._layout_versions[(user_id, course_id)] = layout_version
+
+    def sync_layout(self, user_id, course_id, layout_version, get_remap):
+        """Rename the user's notes for a course to the positions of ``layout_version``.
+
+        ``get_remap(from_version)`` returns {old "s_l": new "s_l" or None}.
+        Directories without a layout file are taken to be at version 1.
+        """
+        if self._layout_versions.get((user_id, course_id)) == layout_version:
+            return
+        course_dir = self._course_dir(user_id, course_id)
+        with self._lock:
+            if not os.path.isdir(course_dir):
+                return
+            try:
+                with open(os.path.join(course_dir, _LAYOUT_FILE)) as f:
+                    saved_version = int(f.read())
+            except (FileNotFoundError, ValueError):
+                saved_version = 1
+
+            if saved_version != layout_version:
+                remap = get_remap(saved_version)
+                usage = self._user_usage(user_id)
+                moves = []
+                for name in os.listdir(course_dir):
+                    match = _LECTURE_FILE_PATTERN.match(name)
+                    if not match or f"{match.group(1)}_{match.group(2)}" not in remap:
+                        continue
+                    new_lecture_id = remap[f"{match.group(1)}_{match.group(2)}"]
+                    if new_lecture_id is None:
+                        size = os.path.getsize(os.path.join(course_dir, name))
+                        os.remove(os.path.join(course_dir, name))
+                        usage['totalBytes'] -= size
+                        usage['noteCount'] -= 1
+                        usage['courses'][course_id] = usage['courses'].get(course_id, 0) - size
+                        if not usage['courses'][course_id]:
+                            del usage['courses'][course_id]
+                    else:
+                        moves.append((name, new_lecture_id + '.txt'))
+                # Two passes so lectures that swapped places do not overwrite each other
+                for name, _ in moves:
+                    os.replace(os.path.join(course_dir, name), os.path.join(course_dir, name + '.move'))
+                for name, new_name in moves:
+                    os.replace(os.path.join(course_dir, name + '.move'), os.path.join(course_dir, new_name))
+            self._write_layout_version(user_id, course_id, layout_version)
+
+    def delete_course(self, user_id, course_id):
+        """Remove all of a user's notes for a course."""
+        course_dir = self._course_dir(user_id, course_id)
+        with self._lock:
+            usage = self._user_usage(user_id)
+            if not os.path.isdir(course_dir):
+                return
+            note_count = sum(1 for name in os.listdir(course_dir) if _LECTURE_FILE_PATTERN.match(name))
+            shutil.rmtree(course_dir)
+            self._layout_versions.pop((user_id, course_id), None)
+            usage['totalBytes'] -= usage['courses'].pop(course_id, 0)
+            usage['noteCount'] -= note_count
+
+    def usage(self, user_id):
+        with self._lock:
+            usage = self._user_usage(user_id)
+            return {
+                'totalBytes': usage['totalBytes'],
+                'noteCount': usage['noteCount'],
+                'quotaBytes': MAX_USER_NOTES_BYTES,
+                'courses': dict(usage['courses'])
+            }
@@ -0,0 +1,273 @@
+"""Progress engine shared by app.py and backend/app.py.
+
+Both apps keep one record per (user, course) in progress.json. Historically
+app.py stored a ``lectures`` map of per-lecture dicts while backend/app.py
+stored ``completedLectures``/``completedSections``/``quizzesPassed`` lists.
+The engine loads either shape into a progress_model.CourseProgress, applies
+updates with constant-time bitmap operations, keeps ``completionPercentage``
+precomputed on the record and writes it back in the compact form. Legacy
+records are upgraded the first time they are loaded and saved.
+
+When given a course_layouts.CourseLayouts, records also remember the layout
+version their positions refer to, and a record saved before the course was
+restructured is moved through the layout remap table as it is loaded.
+"""
+import uuid
+from datetime import datetime
+
+from progress_model import CourseProgress
+
+PROGRESS_FORMAT = 'bitset-v1'
+
+# Share of correct answers needed to pass a quiz
+QUIZ_PASSING_RATIO = 0.7
+
+# Video position (percent) at which a lecture counts as watched
+VIDEO_COMPLETION_PERCENT = 90
+
+LEGACY_LIST_KEYS = ('completedLectures', 'completedSections', 'quizzesPassed')
+
+# Number of (version, lecture) changes kept per record for delta sync
+CHANGE_LOG_SIZE = 50
+
+
+def _split_lecture_id(lecture_id):
+    try:
+        section_index, lecture_index = (int(i) for i in str(lecture_id).split('_'))
+    except ValueError:
+        return None
+    return section_index, lecture_index
+
+
+def quiz_passes(score, total_questions):
+    return bool(total_questions) and score / total_questions >= QUIZ_PASSING_RATIO
+
+
+class ProgressEngine:
+    """Loads, updates and serializes progress records.
+
+    ``get_section_lecture_counts(course_id)`` returns the number of lectures
+    in each section of a course, or None if the course does not exist.
+    ``course_layouts`` is optional; without it positions are taken as-is.
+    ``round_percentage`` rounds completionPercentage to the nearest percent
+    instead of flooring it, and ``quiz_completes_lecture`` controls whether a
+    passed quiz also marks its lecture completed; backend/app.py keeps its
+    original rounding and quiz rules through these.
+    """
+
+    def __init__(self, get_section_lecture_counts, course_layouts=None,
+                 round_percentage=False, quiz_completes_lecture=True):
+        self.get_section_lecture_counts = get_section_lecture_counts
+        self.course_layouts = course_layouts
+        self.round_percentage = round_percentage
+        self.quiz_completes_lecture = quiz_completes_lecture
+
+    def create(self, user_id, course_id, **fields):
+        now = datetime.now().isoformat()
+        record = {
+            'id': str(uuid.uuid4()),
+            'userId': user_id,
+            'courseId': course_id,
+            'completionPercentage': 0,
+            'completedCount': 0,
+            'lastWatchedSection': 0,
+            'lastWatchedLecture': 0,
+            'createdAt': now,
+            'updatedAt': now
+        }
+        if self.course_layouts:
+            record['layoutVersion'] = self.course_layouts.current_version(course_id)
+        record.update(fields)
+        return CourseProgress(record, self.get_section_lecture_counts(course_id) or [])
+
+    def load(self, record):
+        counts = self.get_section_lecture_counts(record['courseId'])
+
+        if record.get('progressFormat') == PROGRESS_FORMAT:
+            progress = CourseProgress.from_compact(record)
+        elif 'lectures' in record:
+            progress = self._upgrade_lectures_record(record, counts or [])
+        else:
+            progress = self._upgrade_list_record(record, counts or [])
+
+        if self.course_layouts and counts is not None:
+            progress = self._resolve_layout(progress, counts)
+        # The course was restructured since this record was saved
+        if counts is not None and progress.section_lecture_counts() != counts:
+            progress = CourseProgress.from_record(progress.to_record(), counts)
+
+        self._refresh_counters(progress)
+        return progress
+
+    def dump(self, progress):
+        record = progress.to_compact()
+        record['progressFormat'] = PROGRESS_FORMAT
+        return record
+
+    def _resolve_layout(self, progress, counts):
+        course_id = progress.fields['courseId']
+        current = self.course_layouts.current_version(course_id)
+        # Records from before layouts were tracked refer to the first one
+        saved = progress.fields.get('layoutVersion', 1)
+        if not current or saved == current:
+            if current:
+                progress.fields['layoutVersion'] = current
+            return progress
+
+        remap = self.course_layouts.remap(course_id, saved)
+        record = progress.to_record()
+        lectures = {}
+        for lecture_id, entry in record['lectures'].items():
+            new_lecture_id = remap.get(lecture_id, lecture_id)
+            if new_lecture_id is None:
+                continue
+            if new_lecture_id != lecture_id and isinstance(entry, dict):
+                section_index, lecture_index = _split_lecture_id(new_lecture_id)
+                entry = dict(entry, sectionIndex=section_index, lectureIndex=lecture_index)
+            lectures[new_lecture_id] = entry
+        record['lectures'] = lectures
+
+        last_watched = remap.get(f"{record.get('lastWatchedSection', 0)}_{record.get('lastWatchedLecture', 0)}")
+        if last_watched:
+            record['lastWatchedSection'], record['lastWatchedLecture'] = _split_lecture_id(last_watched)
+
+        # Changed positions invalidate earlier deltas, so clients refetch in full
+        record['version'] = record.get('version', 0) + 1
+        record['changeLog'] = []
+        record['layoutVersion'] = current
+        return CourseProgress.from_record(record, counts)
+
+    # Online migration of the two legacy record shapes
+
+    def _upgrade_lectures_record(self, record, counts):
+        progress = CourseProgress.from_record(record, counts)
+        for lecture_id, entry in record.get('lectures', {}).items():
+            if isinstance(entry, dict) and quiz_passes(entry.get('quiz_score', 0), entry.get('quiz_total', 0)):
+                indices = _split_lecture_id(lecture_id)
+                if indices:
+                    progress.pass_quiz(*indices)
+        return progress
+
+    def _upgrade_list_record(self, record, counts):
+        fields = {k: v for k, v in record.items() if k not in LEGACY_LIST_KEYS}
+        fields.setdefault('updatedAt', record.get('lastActivity', datetime.now().isoformat()))
+        progress = CourseProgress(fields, counts)
+        for lecture_id in record.get('completedLectures', []):
+            indices = _split_lecture_id(lecture_id)
+            if indices:
+                progress.complete(*indices)
+        for lecture_id in record.get('quizzesPassed', []):
+            indices = _split_lecture_id(lecture_id)
+            if indices:
+                progress.pass_quiz(*indices)
+        return progress
+
+    # Updates
+
+    def _refresh_counters(self, progress):
+        completed_count = progress.completed_count()
+        progress.fields['completedCount'] = completed_count
+        if progress.lecture_count > 0:
+            percentage = (completed_count / progress.lecture_count) * 100
+            progress.fields['completionPercentage'] = round(percentage) if self.round_percentage else int(percentage)
+        else:
+            progress.fields.setdefault('completionPercentage', 0)
+
+    def _record_change(self, progress, section_index, lecture_index):
+        version = progress.fields.get('version', 0) + 1
+        change_log = progress.fields.setdefault('changeLog', [])
+        change_log.append([version, f"{section_index}_{lecture_index}"])
+        del change_log[:-CHANGE_LOG_SIZE]
+        progress.fields['version'] = version
+
+    def touch(self, progress, section_index=None, lecture_index=None):
+        if section_index is not None and lecture_index is not None:
+            progress.fields['lastWatchedSection'] = section_index
+            progress.fields['lastWatchedLecture'] = lecture_index
+        now = datetime.now().isoformat()
+        progress.fields['updatedAt'] = now
+        # backend/app.py records carry their timestamp as lastActivity
+        if 'lastActivity' in progress.fields:
+            progress.fields['lastActivity'] = now
+
+    def complete_lecture(self, progress, section_index, lecture_index):
+        newly_completed = progress.complete(section_index, lecture_index)
+        if newly_completed:
+            self._refresh_counters(progress)
+            self._record_change(progress, section_index, lecture_index)
+        return newly_completed
+
+    def record_quiz(self, progress, section_index, lecture_index, answers, score, total_questions):
+        progress.set_quiz(section_index, lecture_index, answers, score, total_questions)
+        passed = quiz_passes(score, total_questions)
+        if passed:
+            progress.pass_quiz(section_index, lecture_index)
+            if self.quiz_completes_lecture:
+                progress.complete(section_index, lecture_index)
+                self._refresh_counters(progress)
+        self._record_change(progress, section_index, lecture_index)
+        return passed
+
+    def track_video(self, progress, section_index, lecture_index, progress_percent):
+        progress.set_video_progress(section_index, lecture_index, progress_percent)
+        if progress_percent >= VIDEO_COMPLETION_PERCENT:
+            progress.complete(section_index, lecture_index)
+            self._refresh_counters(progress)
+        self._record_change(progress, section_index, lecture_index)
+
+    def completed_sections(self, progress):
+        return [str(s_index) for s_index in range(len(progress.section_completed))
+                if progress.is_section_completed(s_index)]
+
+    # Response shapes
+
+    def to_lectures_record(self, progress):
+        record = progress.to_record()
+        record.pop('progressFormat', None)
+        record.pop('changeLog', None)
+        record.setdefault('version', 0)
+        return record
+
+    def to_delta(self, progress, since):
+        """Lectures changed after version ``since``, or None if the change log
+        no longer reaches back that far and the caller needs a full record."""
+        version = progress.fields.get('version', 0)
+        change_log = progress.fields.get('changeLog', [])
+        if since > version:
+            return None
+        if since < version and (not change_log or change_log[0][0] > since + 1):
+            return None
+
+        lectures = {}
+        for change_version, lecture_id in change_log:
+            if change_version > since and lecture_id not in lectures:
+                section_index, lecture_index = _split_lecture_id(lecture_id)
+                lectures[lecture_id] = progress.lecture_entry(section_index, lecture_index)
+
+        delta = {k: v for k, v in progress.fields.items() if k not in ('progressFormat', 'changeLog')}
+        delta['version'] = version
+        delta['since'] = since
+        delta['lectures'] = lectures
+        return delta
+
+    def to_summary(self, progress):
+        completed_lectures = []
+        quizzes_passed = []
+        for position in progress.completed:
+            completed_lectures.append('{}_{}'.format(*progress.indices(position)))
+        for position in progress.passed:
+            quizzes_passed.append('{}_{}'.format(*progress.indices(position)))
+        for lecture_id, entry in progress.overflow.items():
+            if not isinstance(entry, dict):
+                continue
+            if entry.get('completed') is True:
+                completed_lectures.append(lecture_id)
+            if entry.get('quiz_passed') is True:
+                quizzes_passed.append(lecture_id)
+
+        return {
+            'completedLectures': completed_lectures,
+            'completedSections': self.completed_sections(progress),
+            'quizzesPassed': quizzes_passed,
+            'completionPercentage': progress.fields.get('completionPercentage', 0)
+        }
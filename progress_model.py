@@ -0,0 +1,331 @@
+"""Compact representation of one student's progress through one course.
+
+Lecture completion and passed quizzes are bitmaps over the course's lectures
+in section order, with per-section counters kept alongside them. Notes, quiz
+answers and video positions live in sparse side tables that only hold lectures
+which actually have them. CourseProgress.from_record() and
+to_record() convert losslessly to and from the dict shape kept in
+progress.json, where every lecture is a
+``"{section}_{lecture}" -> {sectionIndex, lectureIndex, completed, notes,
+quiz_answers}`` entry.
+"""
+import base64
+from bisect import bisect_right
+
+LECTURE_KEYS = {'sectionIndex', 'lectureIndex', 'completed', 'notes', 'quiz_answers',
+                'quiz_score', 'quiz_total', 'quiz_passed', 'video_progress'}
+QUIZ_KEYS = ('quiz_answers', 'quiz_score', 'quiz_total', 'quiz_passed')
+COMPACT_KEYS = ('sectionLectureCounts', 'completed', 'present', 'notes', 'quiz', 'video', 'overflow')
+
+
+class LectureBitmap:
+    """Fixed-size set of lecture positions backed by a bytearray."""
+    __slots__ = ('size', 'bits')
+
+    def __init__(self, size, bits=None):
+        self.size = size
+        self.bits = bytearray((size + 7) // 8) if bits is None else bytearray(bits)
+
+    def __contains__(self, position):
+        return 0 <= position < self.size and bool(self.bits[position >> 3] & (1 << (position & 7)))
+
+    def __iter__(self):
+        for byte_index, byte in enumerate(self.bits):
+            while byte:
+                low_bit = byte & -byte
+                yield (byte_index << 3) + low_bit.bit_length() - 1
+                byte ^= low_bit
+
+    def __len__(self):
+        return sum(bin(byte).count('1') for byte in self.bits)
+
+    def add(self, position):
+        if position in self:
+            return False
+        self.bits[position >> 3] |= 1 << (position & 7)
+        return True
+
+    def discard(self, position):
+        if position not in self:
+            return False
+        self.bits[position >> 3] &= ~(1 << (position & 7)) & 0xFF
+        return True
+
+    def to_base64(self):
+        return base64.b64encode(bytes(self.bits)).decode('ascii')
+
+    @classmethod
+    def from_base64(cls, size, data):
+        return cls(size, base64.b64decode(data))
+
+
+class CourseProgress:
+    """Progress record for one (user, course) pair.
+
+    ``fields`` holds the top-level record keys (id, userId, completionPercentage,
+    ...). Lectures are addressed by their flat position in the course; entries
+    that do not fit the course structure or the standard lecture shape are
+    kept verbatim in ``overflow`` so that nothing is lost on a round trip.
+    """
+    __slots__ = ('fields', 'section_offsets', 'lecture_count', 'completed', 'present', 'passed',
+                 'notes', 'quiz', 'video', 'overflow', 'section_completed', 'section_passed')
+
+    def __init__(self, fields, section_lecture_counts):
+        self.fields = fields
+        self.section_offsets = []
+        offset = 0
+        for count in section_lecture_counts:
+            self.section_offsets.append(offset)
+            offset += count
+        self.section_offsets.append(offset)
+        self.lecture_count = offset
+        self.completed = LectureBitmap(offset)
+        self.present = LectureBitmap(offset)
+        self.passed = LectureBitmap(offset)
+        self.section_completed = [0] * len(section_lecture_counts)
+        self.section_passed = [0] * len(section_lecture_counts)
+        self.notes = {}
+        self.quiz = {}
+        self.video = {}
+        self.overflow = {}
+
+    # Position helpers
+
+    def position(self, section_index, lecture_index):
+        if not isinstance(section_index, int) or not isinstance(lecture_index, int):
+            return None
+        if not 0 <= section_index < len(self.section_offsets) - 1:
+            return None
+        start = self.section_offsets[section_index]
+        if not 0 <= lecture_index < self.section_offsets[section_index + 1] - start:
+            return None
+        return start + lecture_index
+
+    def section_lecture_counts(self):
+        return [self.section_offsets[i + 1] - self.section_offsets[i]
+                for i in range(len(self.section_offsets) - 1)]
+
+    def indices(self, position):
+        # bisect_right skips empty sections, which share their offset with the next one
+        section_index = bisect_right(self.section_offsets, position) - 1
+        return section_index, position - self.section_offsets[section_index]
+
+    def _locate(self, section_index, lecture_index):
+        # None means the lecture is tracked in overflow rather than the bitmaps
+        if f"{section_index}_{lecture_index}" in self.overflow:
+            return None
+        return self.position(section_index, lecture_index)
+
+    def _overflow_entry(self, section_index, lecture_index):
+        lecture_id = f"{section_index}_{lecture_index}"
+        if lecture_id not in self.overflow:
+            self.overflow[lecture_id] = {
+                'sectionIndex': section_index,
+                'lectureIndex': lecture_index,
+                'completed': False,
+                'notes': '',
+                'quiz_answers': {}
+            }
+        return self.overflow[lecture_id]
+
+    # Lecture state
+
+    def is_completed(self, section_index, lecture_index):
+        position = self._locate(section_index, lecture_index)
+        if position is None:
+            entry = self.overflow.get(f"{section_index}_{lecture_index}")
+            return bool(entry and entry.get('completed'))
+        return position in self.completed
+
+    def complete(self, section_index, lecture_index):
+        position = self._locate(section_index, lecture_index)
+        if position is None:
+            entry = self._overflow_entry(section_index, lecture_index)
+            newly_completed = not entry.get('completed')
+            entry['completed'] = True
+            return newly_completed
+        self.present.add(position)
+        if not self.completed.add(position):
+            return False
+        self.section_completed[self.indices(position)[0]] += 1
+        return True
+
+    def is_quiz_passed(self, section_index, lecture_index):
+        position = self._locate(section_index, lecture_index)
+        if position is None:
+            entry = self.overflow.get(f"{section_index}_{lecture_index}")
+            return bool(entry and entry.get('quiz_passed'))
+        return position in self.passed
+
+    def pass_quiz(self, section_index, lecture_index):
+        position = self._locate(section_index, lecture_index)
+        if position is None:
+            entry = self._overflow_entry(section_index, lecture_index)
+            newly_passed = not entry.get('quiz_passed')
+            entry['quiz_passed'] = True
+            return newly_passed
+        self.present.add(position)
+        self.quiz.setdefault(position, {})['quiz_passed'] = True
+        if not self.passed.add(position):
+            return False
+        self.section_passed[self.indices(position)[0]] += 1
+        return True
+
+    def is_section_completed(self, section_index):
+        # A section is done once every lecture is completed and its quiz passed
+        if not 0 <= section_index < len(self.section_completed):
+            return False
+        lecture_count = self.section_offsets[section_index + 1] - self.section_offsets[section_index]
+        return lecture_count > 0 and \
+            self.section_completed[section_index] == lecture_count == self.section_passed[section_index]
+
+    def get_notes(self, section_index, lecture_index):
+        position = self._locate(section_index, lecture_index)
+        if position is None:
+            return self.overflow.get(f"{section_index}_{lecture_index}", {}).get('notes', '')
+        return self.notes.get(position, '')
+
+    def set_notes(self, section_index, lecture_index, notes):
+        position = self._locate(section_index, lecture_index)
+        if position is None:
+            self._overflow_entry(section_index, lecture_index)['notes'] = notes
+            return
+        self.present.add(position)
+        if notes:
+            self.notes[position] = notes
+        else:
+            self.notes.pop(position, None)
+
+    def set_quiz(self, section_index, lecture_index, answers, score, total_questions):
+        quiz = {'quiz_answers': answers, 'quiz_score': score, 'quiz_total': total_questions}
+        position = self._locate(section_index, lecture_index)
+        if position is None:
+            self._overflow_entry(section_index, lecture_index).update(quiz)
+            return
+        self.present.add(position)
+        # A quiz stays passed even if a later attempt scores lower
+        if position in self.passed:
+            quiz['quiz_passed'] = True
+        self.quiz[position] = quiz
+
+    def get_video_progress(self, section_index, lecture_index):
+        position = self._locate(section_index, lecture_index)
+        if position is None:
+            return self.overflow.get(f"{section_index}_{lecture_index}", {}).get('video_progress', 0)
+        return self.video.get(position, 0)
+
+    def set_video_progress(self, section_index, lecture_index, progress_percent):
+        position = self._locate(section_index, lecture_index)
+        if position is None:
+            self._overflow_entry(section_index, lecture_index)['video_progress'] = progress_percent
+            return
+        self.present.add(position)
+        self.video[position] = progress_percent
+
+    def completed_count(self):
+        # Overflow entries are only kept for the round trip; they do not count
+        # towards completion
+        return sum(self.section_completed)
+
+    def _recount(self):
+        self.section_completed = [0] * len(self.section_completed)
+        self.section_passed = [0] * len(self.section_passed)
+        self.passed = LectureBitmap(self.lecture_count)
+        for position in self.completed:
+            self.section_completed[self.indices(position)[0]] += 1
+        for position, quiz in self.quiz.items():
+            if quiz.get('quiz_passed') is True:
+                self.passed.add(position)
+                self.section_passed[self.indices(position)[0]] += 1
+
+    # Conversion to and from the progress.json record shape
+
+    @classmethod
+    def from_record(cls, record, section_lecture_counts):
+        fields = {k: v for k, v in record.items() if k != 'lectures'}
+        progress = cls(fields, section_lecture_counts)
+
+        for lecture_id, entry in record.get('lectures', {}).items():
+            position = None
+            if isinstance(entry, dict) and set(entry) <= LECTURE_KEYS and \
+                    'completed' in entry and 'notes' in entry and 'quiz_answers' in entry and \
+                    isinstance(entry['notes'], str) and \
+                    lecture_id == f"{entry.get('sectionIndex')}_{entry.get('lectureIndex')}":
+                position = progress.position(entry['sectionIndex'], entry['lectureIndex'])
+
+            if position is None or not isinstance(entry['completed'], bool):
+                progress.overflow[lecture_id] = entry
+                continue
+
+            progress.present.add(position)
+            if entry['completed']:
+                progress.completed.add(position)
+            if entry['notes']:
+                progress.notes[position] = entry['notes']
+            quiz = {k: entry[k] for k in QUIZ_KEYS if k in entry and (k != 'quiz_answers' or entry[k] != {})}
+            if quiz:
+                progress.quiz[position] = quiz
+            if 'video_progress' in entry:
+                progress.video[position] = entry['video_progress']
+
+        progress._recount()
+        return progress
+
+    def _entry(self, position):
+        section_index, lecture_index = self.indices(position)
+        entry = {
+            'sectionIndex': section_index,
+            'lectureIndex': lecture_index,
+            'completed': position in self.completed,
+            'notes': self.notes.get(position, ''),
+            'quiz_answers': {}
+        }
+        entry.update(self.quiz.get(position, {}))
+        if position in self.video:
+            entry['video_progress'] = self.video[position]
+        return entry
+
+    def lecture_entry(self, section_index, lecture_index):
+        # The lecture's entry in the record shape, or None if it has none
+        position = self._locate(section_index, lecture_index)
+        if position is None:
+            return self.overflow.get(f"{section_index}_{lecture_index}")
+        return self._entry(position) if position in self.present else None
+
+    def to_record(self):
+        lectures = {}
+        for position in self.present:
+            lectures['{}_{}'.format(*self.indices(position))] = self._entry(position)
+        lectures.update(self.overflow)
+
+        record = dict(self.fields)
+        record['lectures'] = lectures
+        return record
+
+    # Compact storage form, flattened next to the top-level record fields
+
+    def to_compact(self):
+        record = dict(self.fields)
+        record.update({
+            'sectionLectureCounts': self.section_lecture_counts(),
+            'completed': self.completed.to_base64(),
+            'present': self.present.to_base64(),
+            'notes': {str(position): notes for position, notes in self.notes.items()},
+            'quiz': {str(position): quiz for position, quiz in self.quiz.items()},
+            'video': {str(position): value for position, value in self.video.items()},
+            'overflow': self.overflow
+        })
+        return record
+
+    @classmethod
+    def from_compact(cls, record):
+        fields = {k: v for k, v in record.items() if k not in COMPACT_KEYS}
+        progress = cls(fields, record['sectionLectureCounts'])
+        progress.completed = LectureBitmap.from_base64(progress.lecture_count, record['completed'])
+        progress.present = LectureBitmap.from_base64(progress.lecture_count, record['present'])
+        progress.notes = {int(position): notes for position, notes in record.get('notes', {}).items()}
+        progress.quiz = {int(position): quiz for position, quiz in record.get('quiz', {}).items()}
+        progress.video = {int(position): value for position, value in record.get('video', {}).items()}
+        progress.overflow = record.get('overflow', {})
+        progress._recount()
+        return progress
@@ -0,0 +1,140 @@
+"""Lecture Q&A kept outside of courses.json.
+
+Questions and later changes to them (answers, edits) are appended as events to
+an NDJSON file, so asking or answering never rewrites the course document.
+Question ids are allocated from one counter for the whole store and only ever
+increase, which makes them usable as pagination cursors: a lecture's ids are
+kept in ascending order and a page starts with a binary search for the cursor.
+The counter is advanced under an exclusive lock on the log file, after reading
+every question appended so far, so processes sharing the file never hand out
+the same id.
+
+Given the course layouts (see course_layouts.py), questions are stamped with
+the layout version they were asked under and moved to the current lecture
+positions when a course's questions are next read after a restructure.
+"""
+import threading
+from bisect import bisect_right
+from datetime import datetime
+
+from course_layouts import RecordPositions
+from ndjson_log import NdjsonLog
+
+PENDING_ANSWER = "Pending instructor response..."
+
+# Fields of a question that update events may change
+UPDATABLE_FIELDS = ('question', 'answer', 'answeredBy', 'answeredAt', 'updatedAt')
+
+
+class QnaStore:
+
+    def __init__(self, path, course_layouts=None):
+        self.lock = threading.RLock()
+        self._by_id = {}
+        self._by_lecture = {}
+        self._last_id = 0
+        self._listeners = []
+        self._positions = RecordPositions(course_layouts) if course_layouts else None
+        self._log = NdjsonLog(path, self._apply)
+        with self.lock:
+            self._log.catch_up()
+
+    def _apply(self, event):
+        if event.get('type') == 'question':
+            question = {k: v for k, v in event.items() if k != 'type'}
+            self._by_id[question['id']] = question
+            if self._positions is not None:
+                self._positions.track(question)
+            self._place(question)
+            self._last_id = max(self._last_id, question['id'])
+            for listener in self._listeners:
+                listener(question)
+        elif event.get('type') == 'update' and event.get('id') in self._by_id:
+            question = self._by_id[event['id']]
+            question.update({k: v for k, v in event.items() if k in UPDATABLE_FIELDS})
+            for listener in self._listeners:
+                listener(question)
+
+    def _place(self, question):
+        self._by_lecture.setdefault(
+            (question['courseId'], f"{question['sectionIndex']}_{question['lectureIndex']}"), []
+        ).append(question['id'])
+
+    def _catch_up(self, course_id=None):
+        self._log.catch_up()
+        if course_id is not None and self._positions is not None and self._positions.sync(course_id):
+            # The course was restructured: re-place its questions at their new
+            # positions, leaving out those of removed lectures
+            for key in [key for key in self._by_lecture if key[0] == course_id]:
+                del self._by_lecture[key]
+            for question in self._positions.records(course_id):
+                if question.get('sectionIndex') is not None:
+                    self._place(question)
+
+    def subscribe(self, listener):
+        # listener(question) sees every question as it is added or changed
+        with self.lock:
+            self._log.catch_up()
+            self._listeners.append(listener)
+
+    def add(self, questions):
+        """Store new questions, assigning ids in order; returns the stored copies."""
+        with self.lock, self._log.exclusive():
+            self._log.catch_up()
+            events = []
+            for question in questions:
+                self._last_id += 1
+                event = dict(question, type='question', id=self._last_id)
+                event.setdefault('answer', PENDING_ANSWER)
+                event.setdefault('askedAt', datetime.now().isoformat())
+                if self._positions is not None:
+                    self._positions.stamp(event)
+                events.append(event)
+            self._log.append(events)
+            return [dict(self._by_id[event['id']]) for event in events]
+
+    def ask(self, course_id, section_index, lecture_index, question, asked_by, asked_by_id):
+        return self.add([{
+            'courseId': course_id,
+            'sectionIndex': section_index,
+            'lectureIndex': lecture_index,
+            'question': question,
+            'askedBy': asked_by,
+            'askedById': asked_by_id
+        }])[0]
+
+    def update(self, question_id, **fields):
+        """Apply an answer or edit; returns the updated question or None if unknown."""
+        with self.lock:
+            self._log.catch_up()
+            if question_id not in self._by_id:
+                return None
+            event = {k: v for k, v in fields.items() if k in UPDATABLE_FIELDS}
+            event.update({'type': 'update', 'id': question_id, 'updatedAt': datetime.now().isoformat()})
+            self._log.append([event])
+            return dict(self._by_id[question_id])
+
+    def get(self, question_id):
+        with self.lock:
+            self._log.catch_up()
+            question = self._by_id.get(question_id)
+            return dict(question) if question else None
+
+    def page(self, course_id, section_index, lecture_index, after=0, limit=20):
+        """Questions of a lecture with an id above ``after``, oldest first.
+
+        Returns (questions, next_cursor); next_cursor is None on the last page.
+        """
+        with self.lock:
+            self._catch_up(course_id)
+            ids = self._by_lecture.get((course_id, f"{section_index}_{lecture_index}"), [])
+            start = bisect_right(ids, after)
+            page_ids = ids[start:start + limit]
+            next_cursor = page_ids[-1] if start + limit < len(ids) else None
+            return [dict(self._by_id[question_id]) for question_id in page_ids], next_cursor
+
+    def lecture_questions(self, course_id, section_index, lecture_index):
+        with self.lock:
+            self._catch_up(course_id)
+            ids = self._by_lecture.get((course_id, f"{section_index}_{lecture_index}"), [])
+            return [dict(self._by_id[question_id]) for question_id in ids]
@@ -0,0 +1,134 @@
+"""Near-duplicate detection for lecture questions.
+
+Each question is reduced to the set of character 3-grams of its normalized
+words, summarized by a MinHash signature, and the signature is split into LSH
+bands. Two questions that share any band land in the same bucket, so finding
+candidates for a new question is a handful of dict lookups; candidates are then
+ranked by the exact Jaccard similarity of their shingle sets. Indexes are kept
+per lecture, built from the Q&A store on first use and updated as questions
+are asked or edited.
+"""
+import re
+import zlib
+
+NUM_HASHES = 64
+# 32 bands of 2 rows put the LSH threshold, (1/BANDS) ** (1/ROWS_PER_BAND), near
+# a Jaccard of 0.18, below MIN_SIMILARITY, so a pair at 0.3 still shares a band
+# about 95% of the time
+BANDS = 32
+ROWS_PER_BAND = NUM_HASHES // BANDS
+SHINGLE_SIZE = 3
+
+# Candidates below this Jaccard similarity are not suggested
+MIN_SIMILARITY = 0.3
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed coefficients so signatures do not depend on the process
+_COEFFICIENTS = [((i + 1) * 0x9E3779B1 % _PRIME, (i + 7) * 0x85EBCA6B % _PRIME) for i in range(NUM_HASHES)]
+_WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def shingles(text):
+    words = _WORD_PATTERN.findall(text.lower())
+    normalized = ' '.join(words)
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def minhash(shingle_set):
+    hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingle_set]
+    if not hashes:
+        return (_MAX_HASH,) * NUM_HASHES
+    return tuple(min((a * h + b) % _PRIME & _MAX_HASH for h in hashes) for a, b in _COEFFICIENTS)
+
+
+def bands(signature):
+    return [(band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]) for band in range(BANDS)]
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class LectureQuestionIndex:
+    """MinHash/LSH buckets over the questions of one lecture."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.entries = {}
+
+    def add(self, question_id, text):
+        self.remove(question_id)
+        shingle_set = shingles(text)
+        signature = minhash(shingle_set)
+        self.entries[question_id] = (shingle_set, signature)
+        for key in bands(signature):
+            self.buckets.setdefault(key, set()).add(question_id)
+
+    def remove(self, question_id):
+        entry = self.entries.pop(question_id, None)
+        if entry is None:
+            return
+        for key in bands(entry[1]):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(question_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def similar(self, text, limit):
+        """[(similarity, question_id)] for the closest indexed questions, best first."""
+        shingle_set = shingles(text)
+        candidates = set()
+        for key in bands(minhash(shingle_set)):
+            candidates |= self.buckets.get(key, set())
+        scored = [(jaccard(shingle_set, self.entries[question_id][0]), question_id) for question_id in candidates]
+        scored = [(score, question_id) for score, question_id in scored if score >= MIN_SIMILARITY]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return scored[:limit]
+
+
+class QuestionSimilarity:
+    """Per-lecture near-duplicate indexes kept in step with a qna_store.QnaStore."""
+
+    def __init__(self, qna_store):
+        self.qna_store = qna_store
+        self._indexes = {}
+        qna_store.subscribe(self.record)
+
+    def record(self, question):
+        # Lectures that were never queried are indexed in full on first use
+        index = self._indexes.get((question['courseId'], question['sectionIndex'], question['lectureIndex']))
+        if index is not None:
+            index.add(question['id'], question.get('question', ''))
+
+    def _index(self, course_id, section_index, lecture_index):
+        key = (course_id, section_index, lecture_index)
+        index = self._indexes.get(key)
+        if index is None:
+            index = LectureQuestionIndex()
+            for question in self.qna_store.lecture_questions(course_id, section_index, lecture_index):
+                index.add(question['id'], question.get('question', ''))
+            self._indexes[key] = index
+        return index
+
+    def invalidate(self, course_id):
+        with self.qna_store.lock:
+            for key in [key for key in self._indexes if key[0] == course_id]:
+                del self._indexes[key]
+
+    def suggest(self, course_id, section_index, lecture_index, text, limit=5):
+        """Existing questions of the lecture most similar to ``text``."""
+        with self.qna_store.lock:
+            index = self._index(course_id, section_index, lecture_index)
+            suggestions = []
+            for score, question_id in index.similar(text, limit):
+                question = self.qna_store.get(question_id)
+                if question:
+                    question['similarity'] = round(score, 3)
+                    suggestions.append(question)
+            return suggestions
@@ -0,0 +1,140 @@
+"""Per-question quiz statistics for instructors.
+
+For every quiz question of a course this keeps the number of attempts that
+answered it, how many were correct and a histogram of the options chosen.
+The aggregates are built in bulk from the quiz attempt log the first time a
+course is asked for, then updated incrementally as each graded attempt is
+appended. Bulk builds encode answers as integer codes and use NumPy when it
+is installed, falling back to plain Python otherwise.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from quiz_grading import normalize_answer, submitted_answer
+
+
+def _new_question():
+    return {'attempts': 0, 'correct': 0, 'options': {}}
+
+
+def aggregate(correct_answers, attempts):
+    """Question stats for one quiz from a list of attempts, computed column-wise."""
+    question_count = len(correct_answers)
+    # Code 0 means "not answered"; options are numbered per question as seen
+    vocabularies = [{} for _ in range(question_count)]
+    rows = []
+    for attempt in attempts:
+        answers = attempt.get('answers') or {}
+        row = []
+        for q_index in range(question_count):
+            answer = submitted_answer(answers, q_index)
+            if answer is None:
+                row.append(0)
+            else:
+                row.append(vocabularies[q_index].setdefault(answer, len(vocabularies[q_index]) + 1))
+        rows.append(row)
+    correct_codes = [-1 if answer is None else vocabularies[q_index].get(normalize_answer(answer), -1)
+                     for q_index, answer in enumerate(correct_answers)]
+
+    if np is not None and rows and question_count:
+        codes = np.array(rows, dtype=np.int32)
+        answered = (codes > 0).sum(axis=0)
+        correct = (codes == np.array(correct_codes, dtype=np.int32)).sum(axis=0)
+        histograms = [np.bincount(codes[:, q], minlength=len(vocabularies[q]) + 1).tolist()
+                      for q in range(question_count)]
+        answered, correct = answered.tolist(), correct.tolist()
+    else:
+        answered = [0] * question_count
+        correct = [0] * question_count
+        histograms = [[0] * (len(vocabularies[q]) + 1) for q in range(question_count)]
+        for row in rows:
+            for q_index, code in enumerate(row):
+                histograms[q_index][code] += 1
+                if code:
+                    answered[q_index] += 1
+                    if code == correct_codes[q_index]:
+                        correct[q_index] += 1
+
+    questions = []
+    for q_index in range(question_count):
+        histogram = histograms[q_index]
+        questions.append({
+            'attempts': int(answered[q_index]),
+            'correct': int(correct[q_index]),
+            'options': {option: int(histogram[code]) for option, code in vocabularies[q_index].items()}
+        })
+    return {'submissions': len(attempts), 'questions': questions}
+
+
+class QuizAnalytics:
+    """Question stats per course, kept in step with a quiz_attempts.QuizAttemptLog.
+
+    ``get_answer_key(course_id)`` returns the course's compiled answer key
+    (see quiz_grading) or None if the course no longer exists.
+    """
+
+    def __init__(self, attempt_log, get_answer_key):
+        self.attempt_log = attempt_log
+        self.get_answer_key = get_answer_key
+        self._stats = {}
+        attempt_log.subscribe(self.record)
+
+    def record(self, attempt):
+        # Courses that were never built are aggregated in bulk on first read
+        course_stats = self._stats.get(attempt.get('courseId'))
+        if course_stats is None:
+            return
+        lecture_key = f"{attempt.get('sectionIndex')}_{attempt.get('lectureIndex')}"
+        correct_answers = course_stats['answerKey'].get(lecture_key)
+        if correct_answers is None:
+            return
+
+        quiz = course_stats['quizzes'].setdefault(lecture_key, {
+            'submissions': 0,
+            'questions': [_new_question() for _ in correct_answers]
+        })
+        quiz['submissions'] += 1
+        answers = attempt.get('answers') or {}
+        for q_index, correct_answer in enumerate(correct_answers):
+            answer = submitted_answer(answers, q_index)
+            if answer is None:
+                continue
+            question = quiz['questions'][q_index]
+            question['attempts'] += 1
+            question['options'][answer] = question['options'].get(answer, 0) + 1
+            if correct_answer is not None and answer == normalize_answer(correct_answer):
+                question['correct'] += 1
+
+    def rebuild(self, course_id):
+        with self.attempt_log.lock:
+            answer_key = self.get_answer_key(course_id)
+            if answer_key is None:
+                self._stats.pop(course_id, None)
+                return None
+            quizzes = {}
+            for lecture_key, attempts in self.attempt_log.course_attempts(course_id).items():
+                if lecture_key in answer_key:
+                    quizzes[lecture_key] = aggregate(answer_key[lecture_key], attempts)
+            self._stats[course_id] = {'answerKey': answer_key, 'quizzes': quizzes}
+            return quizzes
+
+    def course_stats(self, course_id):
+        """{"{section}_{lecture}": {submissions, questions: [...]}} for a course."""
+        with self.attempt_log.lock:
+            course_stats = self._stats.get(course_id)
+            # A recompiled answer key means the course's quizzes were edited
+            if course_stats is None or course_stats['answerKey'] is not self.get_answer_key(course_id):
+                quizzes = self.rebuild(course_id)
+                if quizzes is None:
+                    return None
+            else:
+                quizzes = course_stats['quizzes']
+            return {
+                lecture_key: {
+                    'submissions': quiz['submissions'],
+                    'questions': [dict(question, options=dict(question['options'])) for question in quiz['questions']]
+                }
+                for lecture_key, quiz in quizzes.items()
+            }
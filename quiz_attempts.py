@@ -0,0 +1,134 @@
+"""Append-only log of graded quiz attempts, shared by app.py and backend/app.py.
+
+Attempts are stored one JSON object per line, so recording an attempt is a
+single append instead of a rewrite of every earlier attempt. The log is read
+once at startup into in-memory indexes by (user, course) and by
+(course, section, lecture), together with each user's best attempt per quiz.
+Lines appended by another process are picked up on the next read.
+Listeners registered with subscribe() see every attempt as it is indexed.
+
+Given the course layouts (see course_layouts.py), attempts are stamped with
+the layout version they were graded under and moved to the current lecture
+positions when a course's quizzes are next read after a restructure.
+"""
+import threading
+import uuid
+from datetime import datetime
+
+from course_layouts import RecordPositions
+from ndjson_log import NdjsonLog
+
+
+def _lecture_key(section_index, lecture_index):
+    return f"{section_index}_{lecture_index}"
+
+
+def _ratio(attempt):
+    total_questions = attempt.get('totalQuestions') or 0
+    return attempt.get('score', 0) / total_questions if total_questions else 0
+
+
+def build_attempt(user_id, course_id, answers, result):
+    # result is a graded submission from quiz_grading.AnswerKeyIndex
+    return {
+        'id': str(uuid.uuid4()),
+        'userId': user_id,
+        'courseId': course_id,
+        'sectionIndex': result['sectionIndex'],
+        'lectureIndex': result['lectureIndex'],
+        'answers': answers,
+        'score': result['score'],
+        'totalQuestions': result['totalQuestions'],
+        'passed': result['passed'],
+        'submittedAt': datetime.now().isoformat()
+    }
+
+
+class QuizAttemptLog:
+
+    def __init__(self, path, course_layouts=None):
+        # Re-entrant so listeners and derived indexes can read the log under it
+        self.lock = threading.RLock()
+        self._by_user_course = {}
+        self._by_course = {}
+        self._best = {}
+        self._listeners = []
+        self._positions = RecordPositions(course_layouts) if course_layouts else None
+        self._log = NdjsonLog(path, self._index)
+        self._catch_up()
+
+    def _index(self, attempt):
+        self._by_user_course.setdefault((attempt.get('userId'), attempt.get('courseId')), []).append(attempt)
+        if self._positions is not None:
+            self._positions.track(attempt)
+        self._place(attempt)
+
+        for listener in self._listeners:
+            listener(attempt)
+
+    def _place(self, attempt):
+        lecture_key = _lecture_key(attempt.get('sectionIndex'), attempt.get('lectureIndex'))
+        self._by_course.setdefault(attempt.get('courseId'), {}).setdefault(lecture_key, []).append(attempt)
+
+        best = self._best.setdefault((attempt.get('userId'), attempt.get('courseId')), {})
+        # Ties keep the earlier attempt
+        if lecture_key not in best or _ratio(attempt) > _ratio(best[lecture_key]):
+            best[lecture_key] = attempt
+
+    def _catch_up(self, course_id=None):
+        self._log.catch_up()
+        if course_id is not None and self._positions is not None and self._positions.sync(course_id):
+            # The course was restructured: re-place its attempts at their new
+            # positions, leaving out those of removed lectures
+            self._by_course.pop(course_id, None)
+            records = self._positions.records(course_id)
+            for user_id in {attempt.get('userId') for attempt in records}:
+                self._best.pop((user_id, course_id), None)
+            for attempt in records:
+                if attempt.get('sectionIndex') is not None:
+                    self._place(attempt)
+
+    def append(self, attempt):
+        self.extend([attempt])
+        return attempt
+
+    def extend(self, attempts):
+        with self.lock:
+            if self._positions is not None:
+                attempts = [self._positions.stamp(attempt) for attempt in attempts]
+            self._log.append(attempts)
+
+    def subscribe(self, listener):
+        with self.lock:
+            self._catch_up()
+            self._listeners.append(listener)
+
+    def is_empty(self):
+        # backend/app.py seeds an empty log from its legacy quiz_results.json
+        with self.lock:
+            self._catch_up()
+            return self._log.offset == 0
+
+    # Queries
+
+    def history(self, user_id, course_id, section_index=None, lecture_index=None):
+        """A user's attempts for a course, newest first, optionally for one quiz."""
+        with self.lock:
+            self._catch_up(course_id)
+            attempts = self._by_user_course.get((user_id, course_id), [])
+            if section_index is not None and lecture_index is not None:
+                attempts = [a for a in attempts
+                            if a.get('sectionIndex') == section_index and a.get('lectureIndex') == lecture_index]
+            return list(reversed(attempts))
+
+    def best_scores(self, user_id, course_id):
+        """The user's best attempt per quiz, keyed by "{section}_{lecture}"."""
+        with self.lock:
+            self._catch_up(course_id)
+            return dict(self._best.get((user_id, course_id), {}))
+
+    def course_attempts(self, course_id):
+        """All attempts for a course as {"{section}_{lecture}": [attempts]}."""
+        with self.lock:
+            self._catch_up(course_id)
+            return {lecture_key: list(attempts) for lecture_key, attempts in self._by_course.get(course_id, {}).items()}
@@ -0,0 +1,91 @@
+"""Server-side quiz grading shared by app.py and backend/app.py.
+
+A course's answer key is compiled once from every lecture's
+``quiz.questions[].correctAnswer`` into a map of ``"{section}_{lecture}"`` to
+the tuple of correct answers, so grading a submission is one lookup per
+question instead of a walk over the course tree. Submitted answers are keyed
+by question index, as sent by the course player.
+"""
+from progress_engine import quiz_passes
+
+
+def compile_answer_key(course):
+    answer_key = {}
+    for s_index, section in enumerate(course.get('sections', [])):
+        for l_index, lecture in enumerate(section.get('lectures', [])):
+            questions = (lecture.get('quiz') or {}).get('questions') or []
+            if questions:
+                answer_key[f"{s_index}_{l_index}"] = tuple(q.get('correctAnswer') for q in questions)
+    return answer_key
+
+
+def normalize_answer(answer):
+    # Answers compare as strings, so an option sent as 1 matches a key of "1";
+    # quiz_analytics counts correct answers the same way
+    return None if answer is None else str(answer)
+
+
+def submitted_answer(answers, q_index):
+    return normalize_answer(answers.get(str(q_index), answers.get(q_index)))
+
+
+def grade(correct_answers, answers):
+    """Return (score, total_questions) for an answers map of question index -> answer."""
+    score = 0
+    for q_index, correct_answer in enumerate(correct_answers):
+        answer = submitted_answer(answers, q_index)
+        if answer is not None and answer == normalize_answer(correct_answer):
+            score += 1
+    return score, len(correct_answers)
+
+
+class AnswerKeyIndex:
+    """Answer keys by course, recompiled when the course's version changes.
+
+    ``course_version(course)`` returns the version a course dict belongs to;
+    course dicts that are reloaded without changing keep their compiled key.
+    """
+
+    def __init__(self, course_version):
+        self.course_version = course_version
+        self._keys = {}
+
+    def get(self, course):
+        version = self.course_version(course)
+        entry = self._keys.get(course['id'])
+        if entry is None or entry[0] != version:
+            entry = (version, compile_answer_key(course))
+            self._keys[course['id']] = entry
+        return entry[1]
+
+    def invalidate(self, course_id):
+        self._keys.pop(course_id, None)
+
+    def rebind(self, course):
+        # The course changed without touching its quizzes; keep the compiled key
+        entry = self._keys.get(course['id'])
+        if entry is not None:
+            self._keys[course['id']] = (self.course_version(course), entry[1])
+
+    def grade(self, course, section_index, lecture_index, answers):
+        """Grade one submission; None if the lecture has no quiz."""
+        return self.grade_batch(course, [(section_index, lecture_index, answers)])[0]
+
+    def grade_batch(self, course, submissions):
+        # One answer-key lookup for the whole batch of (section, lecture, answers)
+        answer_key = self.get(course)
+        results = []
+        for section_index, lecture_index, answers in submissions:
+            correct_answers = answer_key.get(f"{section_index}_{lecture_index}")
+            if correct_answers is None:
+                results.append(None)
+                continue
+            score, total_questions = grade(correct_answers, answers)
+            results.append({
+                'sectionIndex': section_index,
+                'lectureIndex': lecture_index,
+                'score': score,
+                'totalQuestions': total_questions,
+                'passed': quiz_passes(score, total_questions)
+            })
+        return results
@@ -0,0 +1,80 @@
+"""Per-course quiz leaderboards.
+
+A student's leaderboard score for a course is the sum of their best score on
+each of its quizzes. Each course keeps its students in a list of
+``(-score, userId)`` pairs sorted with bisect, so a student's rank is a binary
+search and the top N is a slice; a new attempt moves only that student's entry.
+Boards are built from the quiz attempt log the first time a course is read and
+can be rebuilt from it at any time.
+"""
+from bisect import bisect_left, insort
+
+
+class QuizLeaderboard:
+
+    def __init__(self, attempt_log):
+        self.attempt_log = attempt_log
+        self._boards = {}
+        attempt_log.subscribe(self.record)
+
+    def _total_score(self, user_id, course_id):
+        return sum(attempt.get('score', 0) for attempt in self.attempt_log.best_scores(user_id, course_id).values())
+
+    def _place(self, board, user_id, score):
+        previous = board['scores'].get(user_id)
+        if previous is not None:
+            if previous == score:
+                return
+            pos = bisect_left(board['order'], (-previous, user_id))
+            del board['order'][pos]
+        board['scores'][user_id] = score
+        insort(board['order'], (-score, user_id))
+
+    def record(self, attempt):
+        # Boards that were never built pick the attempt up when they are built
+        board = self._boards.get(attempt.get('courseId'))
+        if board is not None and attempt.get('userId') is not None:
+            self._place(board, attempt.get('userId'), self._total_score(attempt.get('userId'), attempt.get('courseId')))
+
+    def rebuild(self, course_id):
+        with self.attempt_log.lock:
+            user_ids = {attempt.get('userId')
+                        for attempts in self.attempt_log.course_attempts(course_id).values()
+                        for attempt in attempts if attempt.get('userId') is not None}
+            scores = {user_id: self._total_score(user_id, course_id) for user_id in user_ids}
+            board = {'scores': scores, 'order': sorted((-score, user_id) for user_id, score in scores.items())}
+            self._boards[course_id] = board
+            return board
+
+    def invalidate(self, course_id):
+        with self.attempt_log.lock:
+            self._boards.pop(course_id, None)
+
+    def _board(self, course_id):
+        board = self._boards.get(course_id)
+        return board if board is not None else self.rebuild(course_id)
+
+    def top(self, course_id, limit):
+        """The first ``limit`` entries as dicts with userId, score and rank."""
+        with self.attempt_log.lock:
+            order = self._board(course_id)['order']
+            entries = []
+            for neg_score, user_id in order[:limit]:
+                # Tied students share the rank of the first of them
+                rank = entries[-1]['rank'] if entries and entries[-1]['score'] == -neg_score \
+                    else len(entries) + 1
+                entries.append({'userId': user_id, 'score': -neg_score, 'rank': rank})
+            return entries
+
+    def rank(self, course_id, user_id):
+        """The student's rank and score, or None if they have no attempts."""
+        with self.attempt_log.lock:
+            board = self._board(course_id)
+            score = board['scores'].get(user_id)
+            if score is None:
+                return None
+            return {'userId': user_id, 'score': score, 'rank': bisect_left(board['order'], (-score, '')) + 1}
+
+    def size(self, course_id):
+        with self.attempt_log.lock:
+            return len(self._board(course_id)['scores'])
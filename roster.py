@@ -0,0 +1,84 @@
+"""Sorted course rosters with cursor pagination.
+
+A roster is the list of a course's students as (sort value, user id) keys in
+ascending order, built from the by-course enrollment index and cached until
+one of the data files it was built from changes. A page is a binary search
+for the cursor followed by a walk in either direction, and only the students
+on the page are joined with their user and progress records, so paging
+through a course with tens of thousands of students does not re-sort or
+re-join it on every request.
+"""
+import base64
+import json
+from bisect import bisect_left, bisect_right
+
+ROSTER_SORT_FIELDS = ('name', 'enrolledAt', 'completion')
+
+
+def sort_value(sort, user, enrollment, progress):
+    if sort == 'name':
+        return (user.get('name') or '').lower()
+    if sort == 'enrolledAt':
+        return enrollment.get('enrolledAt') or ''
+    return (progress or {}).get('completionPercentage', 0)
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort):
+    """The (sort value, user id) key in a cursor; raises ValueError if it is malformed."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (TypeError, UnicodeError, ValueError):
+        raise ValueError('Invalid cursor')
+    value_type = (int, float) if sort == 'completion' else str
+    if not isinstance(key, list) or len(key) != 2 or not isinstance(key[1], str) or \
+            isinstance(key[0], bool) or not isinstance(key[0], value_type):
+        raise ValueError('Invalid cursor')
+    return tuple(key)
+
+
+class RosterCache:
+    """Sorted roster keys per (course, sort), rebuilt when ``signature`` changes."""
+
+    def __init__(self):
+        self._entries = {}
+
+    def keys(self, course_id, sort, signature, build):
+        # build() returns the unsorted (sort value, user id) keys
+        entry = self._entries.get((course_id, sort))
+        if entry is None or entry['signature'] != signature:
+            entry = {'signature': signature, 'keys': sorted(build())}
+            self._entries[(course_id, sort)] = entry
+        return entry['keys']
+
+    def invalidate(self, course_id):
+        for sort in ROSTER_SORT_FIELDS:
+            self._entries.pop((course_id, sort), None)
+
+
+def roster_page(keys, descending=False, cursor=None, limit=50, matches=None):
+    """Up to ``limit`` keys after ``cursor`` in the requested order.
+
+    ``matches(user_id)`` filters students; keys are walked until the page is
+    full. Returns (keys, next_cursor); next_cursor is None on the last page.
+    """
+    if descending:
+        position = (bisect_left(keys, cursor) if cursor is not None else len(keys)) - 1
+        step = -1
+    else:
+        position = bisect_right(keys, cursor) if cursor is not None else 0
+        step = 1
+
+    found = []
+    while 0 <= position < len(keys) and len(found) <= limit:
+        if matches is None or matches(keys[position][1]):
+            found.append(keys[position])
+        position += step
+
+    if len(found) > limit:
+        found.pop()
+        return found, encode_cursor(found[-1])
+    return found, None
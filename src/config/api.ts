@@ -20,6 +20,7 @@ export const API_ENDPOINTS = {
     update: (id: string) => `${API_BASE_URL}/courses/${id}`,
     delete: (id: string) => `${API_BASE_URL}/courses/${id}`,
     purchased: `${API_BASE_URL}/courses/purchased`,
+    myLearning: `${API_BASE_URL}/courses/my-learning`,
     enroll: (id: string) => `${API_BASE_URL}/courses/${id}/enroll`,
     content: (id: string) => `${API_BASE_URL}/courses/${id}/content`,
     instructor: `${API_BASE_URL}/courses/instructor`,
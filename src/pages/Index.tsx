@@ -52,9 +52,9 @@ export default function Index() {
         const recommended = await catalogService.getRecommendedCourses();
         setRecommendedCourses(recommended.slice(0, 4).map(convertToCourse));
         
-        // Fetch enrolled courses
-        const purchased = await courseService.getPurchasedCourses();
-        setEnrolledCourses(purchased.map(convertServiceCourse));
+        // Fetch enrolled courses with their progress in one request
+        const myLearning = await courseService.getMyLearning();
+        setEnrolledCourses(myLearning.map(convertServiceCourse));
       } catch (error) {
         console.error("Error fetching data:", error);
         toast.error("Failed to load course data");
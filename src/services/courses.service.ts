@@ -89,5 +89,20 @@ export const courseService = {
       // Return a subset of courses as "purchased"
       return courses.slice(0, 3);
     }
+  },
+  
+  /**
+   * Get enrolled courses together with their progress in a single request
+   */
+  async getMyLearning(): Promise<Course[]> {
+    try {
+      return await apiClient.get<Course[]>(API_ENDPOINTS.courses.myLearning);
+    } catch (error) {
+      console.error('Error fetching my learning:', error);
+      // Fallback to mock data for demo purposes
+      const { courses } = await import('@/lib/mock-data');
+      toast.warning('Using mock data: API connection failed');
+      return courses.slice(0, 3);
+    }
   }
 };
@@ -0,0 +1,127 @@
+"""Day-resolution counters with range rollups.
+
+A DailySeries keeps the days that have data as sorted date ordinals, with
+enrollment counts and revenue in parallel lists. Cumulative sums over those
+lists are rebuilt lazily after an out-of-order insert, so the total for any
+[start, end) range is two binary searches. rollup() walks the bucket
+boundaries of the requested granularity and sums each bucket that way, which
+makes a chart cost O(buckets x log days) no matter how much history there is.
+"""
+from bisect import bisect_left
+from datetime import date, timedelta
+
+GRANULARITIES = ('day', 'week', 'month', 'quarter')
+
+
+def parse_day(value):
+    """Date ordinal of an ISO date or datetime string, or None."""
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except ValueError:
+        return None
+
+
+class DailySeries:
+    __slots__ = ('days', 'counts', 'revenue', '_cumulative_counts', '_cumulative_revenue', '_dirty_from')
+
+    def __init__(self):
+        self.days = []
+        self.counts = []
+        self.revenue = []
+        self._cumulative_counts = [0]
+        self._cumulative_revenue = [0]
+        self._dirty_from = 0
+
+    def add(self, day, count=1, revenue=0):
+        position = bisect_left(self.days, day)
+        if position < len(self.days) and self.days[position] == day:
+            self.counts[position] += count
+            self.revenue[position] += revenue
+        else:
+            # Usually today, so an append
+            self.days.insert(position, day)
+            self.counts.insert(position, count)
+            self.revenue.insert(position, revenue)
+        self._dirty_from = min(self._dirty_from, position)
+
+    def merge(self, other, sign=1):
+        for day, count, revenue in zip(other.days, other.counts, other.revenue):
+            self.add(day, sign * count, sign * revenue)
+
+    def _refresh(self):
+        if self._dirty_from >= len(self.days):
+            return
+        del self._cumulative_counts[self._dirty_from + 1:]
+        del self._cumulative_revenue[self._dirty_from + 1:]
+        for position in range(self._dirty_from, len(self.days)):
+            self._cumulative_counts.append(self._cumulative_counts[-1] + self.counts[position])
+            self._cumulative_revenue.append(self._cumulative_revenue[-1] + self.revenue[position])
+        self._dirty_from = len(self.days)
+
+    def total(self, start, end):
+        """(enrollments, revenue) for days in [start, end)."""
+        self._refresh()
+        lo = bisect_left(self.days, start)
+        hi = bisect_left(self.days, end, lo)
+        return (self._cumulative_counts[hi] - self._cumulative_counts[lo],
+                self._cumulative_revenue[hi] - self._cumulative_revenue[lo])
+
+
+def bucket_start(day, granularity):
+    value = date.fromordinal(day)
+    if granularity == 'week':
+        value -= timedelta(days=value.weekday())
+    elif granularity == 'month':
+        value = value.replace(day=1)
+    elif granularity == 'quarter':
+        value = value.replace(month=(value.month - 1) // 3 * 3 + 1, day=1)
+    return value
+
+
+def next_bucket(value, granularity):
+    if granularity == 'day':
+        return value + timedelta(days=1)
+    if granularity == 'week':
+        return value + timedelta(days=7)
+    months = 1 if granularity == 'month' else 3
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def bucket_label(value, granularity):
+    if granularity == 'month':
+        return value.strftime('%Y-%m')
+    if granularity == 'quarter':
+        return f"{value.year}-Q{(value.month - 1) // 3 + 1}"
+    return value.isoformat()
+
+
+def rollup(series, granularity, start=None, end=None, max_buckets=None):
+    """Buckets covering the days [start, end] (ordinals; default: the series' span).
+
+    Empty buckets inside the range are included so charts have no gaps.
+    Raises ValueError if the range needs more than ``max_buckets`` buckets.
+    """
+    if start is None:
+        if not series.days:
+            return []
+        start = series.days[0]
+    if end is None:
+        if not series.days:
+            return []
+        end = series.days[-1]
+
+    buckets = []
+    current = bucket_start(start, granularity)
+    while current.toordinal() <= end:
+        if max_buckets is not None and len(buckets) >= max_buckets:
+            raise ValueError(f'The range needs more than {max_buckets} buckets')
+        following = next_bucket(current, granularity)
+        enrollments, revenue = series.total(max(current.toordinal(), start), min(following.toordinal(), end + 1))
+        buckets.append({
+            'date': bucket_label(current, granularity),
+            'enrollments': enrollments,
+            'revenue': round(revenue, 2)
+        })
+        current = following
+    return buckets